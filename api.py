@@ -0,0 +1,253 @@
+import json
+from datetime import datetime
+from flask import Blueprint, Response, request, abort
+from app import db, City, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from queries import encode_cursor, decode_cursor
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+# every endpoint is a read
+api.before_request(db.use_replica)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+#----------------------------------------------------------------------------#
+# Encoding.
+#----------------------------------------------------------------------------#
+
+def _default(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(repr(value))
+
+
+def dumps(payload):
+  # orjson serializes datetimes natively and is several times faster;
+  # the stdlib path produces the same ISO 8601 output
+  if orjson is not None:
+    return orjson.dumps(payload)
+  return json.dumps(payload, default=_default, separators=(",", ":"))
+
+
+def json_response(payload, status=200):
+  return Response(dumps(payload), status=status, mimetype="application/json")
+
+
+@api.errorhandler(404)
+def not_found(error):
+  return json_response({"error": "not found"}, 404)
+
+
+@api.errorhandler(400)
+def bad_request(error):
+  return json_response({"error": error.description}, 400)
+
+#----------------------------------------------------------------------------#
+# Request parameters.
+#----------------------------------------------------------------------------#
+
+def _csv_arg(name, allowed):
+  value = request.args.get(name)
+  if not value:
+    return None
+  names = set(v.strip() for v in value.split(",") if v.strip())
+  unknown = names - set(allowed)
+  if unknown:
+    abort(400, f"unknown {name}: {', '.join(sorted(unknown))}")
+  return names
+
+
+def _limit():
+  return max(1, min(request.args.get("limit", DEFAULT_LIMIT, type=int), MAX_LIMIT))
+
+
+def _wants(fields, *names):
+  return fields is None or any(n in fields for n in names)
+
+
+def _sparse(items, fields):
+  if fields is None:
+    return items
+  keep = fields | {"id"}
+  return [dict((k, v) for k, v in item.items() if k in keep) for item in items]
+
+#----------------------------------------------------------------------------#
+# Batched serializers: every helper takes a page of ids and costs one query.
+#----------------------------------------------------------------------------#
+
+def _genres(owner_column, ids):
+  genres = dict((id, []) for id in ids)
+  rows = db.session.query(owner_column, Genre.name) \
+    .join(Genre, Genre.id == owner_column.table.c.genre_id) \
+    .filter(owner_column.in_(ids)) \
+    .order_by(Genre.name)
+  for id, name in rows:
+    genres[id].append(name)
+  return genres
+
+
+def _shows(owner_column, other, ids, now):
+  # all shows of the page in one query, split past/upcoming in Python
+  prefix = "artist" if other is Artist else "venue"
+  shows = dict((id, ([], [])) for id in ids)
+  rows = db.session.query(owner_column, Show.start_time, other.id, other.name, other.image_link) \
+    .join(other, other.id == (Show.artist_id if other is Artist else Show.venue_id)) \
+    .filter(owner_column.in_(ids)) \
+    .order_by(Show.start_time)
+  for owner_id, start_time, id, name, image_link in rows:
+    past, upcoming = shows[owner_id]
+    (upcoming if start_time >= now else past).append({
+      prefix + "_id": id,
+      prefix + "_name": name,
+      prefix + "_image_link": image_link,
+      "start_time": start_time,
+    })
+  return shows
+
+
+def serialize_owners(kind, rows, fields, include):
+  now = datetime.today()
+  ids = [row["id"] for row in rows]
+  if not ids:
+    return []
+  if kind == "venues":
+    owner_column, genre_column, other = Show.venue_id, venue_genres.c.venue_id, Artist
+  else:
+    owner_column, genre_column, other = Show.artist_id, artist_genres.c.artist_id, Venue
+  if _wants(fields, "genres"):
+    genres = _genres(genre_column, ids)
+    for row in rows:
+      row["genres"] = genres[row["id"]]
+  if include and "shows" in include:
+    shows = _shows(owner_column, other, ids, now)
+    for row in rows:
+      row["past_shows"], row["upcoming_shows"] = shows[row["id"]]
+  return _sparse(rows, fields and (fields | {"past_shows", "upcoming_shows"}))
+
+
+def serialize_shows(rows, fields, include):
+  if include:
+    for model, key in ((Venue, "venue"), (Artist, "artist")):
+      if key in include:
+        ids = set(row[key + "_id"] for row in rows)
+        related = dict((r.id, dict(zip(("id", "name", "image_link"), r)))
+          for r in db.session.query(model.id, model.name, model.image_link).filter(model.id.in_(ids))) if ids else {}
+        for row in rows:
+          row[key] = related.get(row[key + "_id"])
+  return _sparse(rows, fields and (fields | (include or set())))
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+VENUE_COLUMNS = [
+  ("id", Venue.id), ("name", Venue.name), ("city", City.name), ("state", Venue.state),
+  ("address", Venue.address), ("phone", Venue.phone), ("website", Venue.website),
+  ("facebook_link", Venue.facebook_link), ("image_link", Venue.image_link),
+  ("seeking_talent", Venue.seeking_talent), ("seeking_description", Venue.seeking_description),
+  ("past_shows_count", Venue.past_shows_count), ("upcoming_shows_count", Venue.upcoming_shows_count),
+]
+
+ARTIST_COLUMNS = [
+  ("id", Artist.id), ("name", Artist.name), ("city", Artist.city), ("state", Artist.state),
+  ("phone", Artist.phone), ("website", Artist.website),
+  ("facebook_link", Artist.facebook_link), ("image_link", Artist.image_link),
+  ("seeking_venue", Artist.seeking_venue), ("seeking_description", Artist.seeking_description),
+  ("past_shows_count", Artist.past_shows_count), ("upcoming_shows_count", Artist.upcoming_shows_count),
+]
+
+SHOW_COLUMNS = [
+  ("id", Show.id), ("venue_id", Show.venue_id), ("venue_name", Venue.name),
+  ("artist_id", Show.artist_id), ("artist_name", Artist.name),
+  ("artist_image_link", Artist.image_link), ("start_time", Show.start_time),
+  ("end_time", Show.end_time),
+]
+
+OWNER_FIELDS = ["genres"]
+
+
+def _base_query(kind):
+  if kind == "venues":
+    columns, model = VENUE_COLUMNS, Venue
+    query = db.session.query(*[c for _, c in columns]).join(City, City.id == Venue.city_id)
+  elif kind == "artists":
+    columns, model = ARTIST_COLUMNS, Artist
+    query = db.session.query(*[c for _, c in columns])
+  else:
+    columns, model = SHOW_COLUMNS, Show
+    query = db.session.query(*[c for _, c in columns]) \
+      .join(Venue, Venue.id == Show.venue_id) \
+      .join(Artist, Artist.id == Show.artist_id)
+  return model, [n for n, _ in columns], query
+
+
+def _serialize(kind, rows, fields, include):
+  if kind == "shows":
+    return serialize_shows(rows, fields, include)
+  return serialize_owners(kind, rows, fields, include)
+
+
+def _options(kind, names):
+  if kind == "shows":
+    return _csv_arg("fields", names), _csv_arg("include", ["venue", "artist"])
+  return _csv_arg("fields", names + OWNER_FIELDS), _csv_arg("include", ["shows"])
+
+
+def list_endpoint(kind):
+  model, names, query = _base_query(kind)
+  fields, include = _options(kind, names)
+  cursor = request.args.get("cursor")
+  if cursor:
+    key = decode_cursor(cursor)
+    if not (isinstance(key, list) and len(key) == 1 and type(key[0]) is int):
+      abort(400, "invalid cursor")
+    query = query.filter(model.id > key[0])
+  limit = _limit()
+  rows = [dict(zip(names, row)) for row in query.order_by(model.id).limit(limit + 1)]
+  next_cursor = encode_cursor(rows[limit - 1]["id"]) if len(rows) > limit else None
+  return json_response({
+    "data": _serialize(kind, rows[:limit], fields, include),
+    "next_cursor": next_cursor,
+  })
+
+
+def detail_endpoint(kind, id):
+  model, names, query = _base_query(kind)
+  fields, include = _options(kind, names)
+  row = query.filter(model.id == id).first()
+  if row is None:
+    abort(404)
+  return json_response({"data": _serialize(kind, [dict(zip(names, row))], fields, include)[0]})
+
+#----------------------------------------------------------------------------#
+# Routes.
+#----------------------------------------------------------------------------#
+
+@api.route("/venues")
+def venues():
+  return list_endpoint("venues")
+
+@api.route("/venues/<int:venue_id>")
+def venue(venue_id):
+  return detail_endpoint("venues", venue_id)
+
+@api.route("/artists")
+def artists():
+  return list_endpoint("artists")
+
+@api.route("/artists/<int:artist_id>")
+def artist(artist_id):
+  return detail_endpoint("artists", artist_id)
+
+@api.route("/shows")
+def shows():
+  return list_endpoint("shows")
+
+@api.route("/shows/<int:show_id>")
+def show(show_id):
+  return detail_endpoint("shows", show_id)
@@ -2,18 +2,23 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import hmac
 import json
+import threading
 import dateutil.parser
-from datetime import datetime
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, stream_with_context, abort
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from flask_migrate import Migrate
-from sqlalchemy import func
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import instrumentation
+from cache import cache, render_cached, conditional, init_templates
+from formatting import format_datetime, state_timezone
+from routing import RoutingSQLAlchemy
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,20 +26,125 @@ from sqlalchemy import func
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 migrate = Migrate(app, db)
+instrumentation.init_app(app)
+cache.init_app(app)
+init_templates(app)
 
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
+def split_shows(shows, serializer, now=None):
+  # one pass over an already loaded collection instead of two filtered queries
+  now = now or datetime.today()
+  past, upcoming = [], []
+  for show in sorted(shows, key=lambda s: s.start_time):
+    if show.start_time >= now:
+      upcoming.append(serializer(show))
+    else:
+      past.append(serializer(show))
+  return past, upcoming
+
+venue_genres = db.Table("venue_genres",
+  db.Column("venue_id", db.Integer, db.ForeignKey("Venue.id", ondelete="CASCADE"), primary_key=True),
+  db.Column("genre_id", db.Integer, db.ForeignKey("Genre.id"), primary_key=True),
+  db.Index("ix_venue_genres_genre_id_venue_id", "genre_id", "venue_id"),
+)
+
+artist_genres = db.Table("artist_genres",
+  db.Column("artist_id", db.Integer, db.ForeignKey("Artist.id", ondelete="CASCADE"), primary_key=True),
+  db.Column("genre_id", db.Integer, db.ForeignKey("Genre.id"), primary_key=True),
+  db.Index("ix_artist_genres_genre_id_artist_id", "genre_id", "artist_id"),
+)
+
+class Genre(db.Model):
+  __tablename__ = "Genre"
+  id = db.Column(db.Integer, primary_key=True)
+  name = db.Column(db.String(120), nullable=False, unique=True)
+
+  @classmethod
+  def resolve(cls, names):
+    # form values -> Genre rows, creating any that do not exist yet
+    names = list(dict.fromkeys(n.strip() for n in names if n and n.strip()))
+    if not names:
+      return []
+    found = {g.name: g for g in cls.query.filter(cls.name.in_(names)).all()}
+    genres = []
+    for name in names:
+      genre = found.get(name)
+      if genre is None:
+        genre = found[name] = cls(name=name)
+        db.session.add(genre)
+      genres.append(genre)
+    return genres
+
+_city_ids = {}
+_city_ids_lock = threading.Lock()
+
 class City(db.Model):
   __tablename__ = "City"
   id = db.Column(db.Integer, primary_key=True) 
   name = db.Column(db.String(120))
   state = db.Column(db.String(10))
+  # from the gazetteer, see `flask geocode`
+  latitude = db.Column(db.Float)
+  longitude = db.Column(db.Float)
   venues = db.relationship("Venue", backref="city_parent", lazy=True)
 
+  @staticmethod
+  def key(name, state):
+    return (" ".join((name or "").split()).lower(), state)
+
+  @classmethod
+  def resolve(cls, name, state):
+    # -> (id, name) of the city, inserting it inside the caller's
+    # transaction if needed. Only ids read back from the table are cached,
+    # never one inserted by a transaction that may still roll back.
+    name = " ".join((name or "").split())
+    key = cls.key(name, state)
+    cached = _city_ids.get(key)
+    if cached is not None:
+      return cached
+    row = db.session.query(cls.id, cls.name) \
+      .filter(func.lower(cls.name) == key[0], cls.state == state).first()
+    if row is not None:
+      with _city_ids_lock:
+        _city_ids[key] = (row.id, row.name)
+      return row.id, row.name
+    if db.engine.dialect.name == "postgresql":
+      # concurrent submissions race on the unique (lower(name), state)
+      # index; the loser inserts nothing and reads the winner's row
+      db.session.execute(pg_insert(cls.__table__).values(name=name, state=state)
+        .on_conflict_do_nothing(index_elements=[func.lower(cls.name), cls.state]))
+      row = db.session.query(cls.id, cls.name) \
+        .filter(func.lower(cls.name) == key[0], cls.state == state).one()
+      return row.id, row.name
+    city = cls(name=name, state=state)
+    db.session.add(city)
+    db.session.flush()
+    return city.id, city.name
+
+  @classmethod
+  def resolve_many(cls, pairs):
+    # {(name, state): (id, name)} with one lookup query for the whole batch
+    wanted = dict(((name, state), cls.key(name, state)) for name, state in pairs)
+    found = dict((key, _city_ids[key]) for key in wanted.values() if key in _city_ids)
+    missing = set(key for key in wanted.values() if key not in found)
+    if missing:
+      rows = db.session.query(cls.id, cls.name, cls.state) \
+        .filter(func.lower(cls.name).in_(set(name for name, _ in missing)))
+      with _city_ids_lock:
+        for row in rows:
+          key = cls.key(row.name, row.state)
+          if key in missing:
+            found[key] = _city_ids[key] = (row.id, row.name)
+    for pair, key in wanted.items():
+      if key not in found:
+        found[key] = cls.resolve(*pair)
+    return dict((pair, found[key]) for pair, key in wanted.items())
+
   def show_venue(self):
     venues = [v.show_venues() for v in self.venues]
     if len(venues) < 1:
@@ -51,7 +161,7 @@ class Venue(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.String(120))
+    genres = db.relationship("Genre", secondary=venue_genres, lazy=True, order_by="Genre.name")
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
@@ -61,17 +171,28 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(320))
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+        server_default=func.now(), onupdate=func.now())
+    # denormalized, as of the last counters roll-over (see counters.py)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     city_id = db.Column(db.Integer, db.ForeignKey('City.id'),
-        nullable=False)
+        nullable=False, index=True)
+    # proximity search, see geo.py
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
     shows = db.relationship("Show", backref='venue', lazy=True)
 
     def get_venue(self):
+      past_shows, upcoming_shows = split_shows(self.shows, Show.venue_shows)
       return {
         "id": self.id, 
         "name": self.name,
-        "genres": self.genres.split(","),
+        "genres": [g.name for g in self.genres],
         "address": self.address,
-        "city": City.query.filter(City.id == self.city_id).first().name, 
+        "city_id": self.city_id,
+        "city": self.city_parent.name, 
         "state": self.state, 
         "phone": self.phone,
         "website": self.website,
@@ -79,10 +200,10 @@ class Venue(db.Model):
         "seeking_talent": self.seeking_talent,
         "seeking_description": self.seeking_description,
         "image_link": self.image_link,
-        "past_shows": self.get_past_shows(),
-        "upcoming_shows": self.get_upcoming_shows(),
-        "past_shows_count": len(self.get_past_shows()),
-        "upcoming_shows_count": len(self.get_upcoming_shows())
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows)
       }
 
     def get_upcoming_shows(self):
@@ -110,20 +231,26 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship("Genre", secondary=artist_genres, lazy=True, order_by="Genre.name")
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(320))
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+        server_default=func.now(), onupdate=func.now())
+    # denormalized, as of the last counters roll-over (see counters.py)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     shows = db.relationship("Show", backref='artist', lazy=True)
 
 
     def get_artist(self):
+      past_shows, upcoming_shows = split_shows(self.shows, Show.artist_shows)
       return {
         "id": self.id, 
         "name": self.name,
-        "genres": self.genres.split(","),
+        "genres": [g.name for g in self.genres],
         "city": self.city, 
         "state": self.state, 
         "phone": self.phone,
@@ -132,10 +259,10 @@ class Artist(db.Model):
         "seeking_venue": self.seeking_venue,
         "seeking_description": self.seeking_description,
         "image_link": self.image_link,
-        "past_shows": self.get_past_shows(),
-        "upcoming_shows": self.get_upcoming_shows(),
-        "past_shows_count": len(self.get_past_shows()),
-        "upcoming_shows_count": len(self.get_upcoming_shows())
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows)
       }
 
     def get_upcoming_shows(self):
@@ -156,14 +283,58 @@ class Artist(db.Model):
         
 
 
+class Checkpoint(db.Model):
+  # named timestamps for periodic jobs
+  __tablename__ = "Checkpoint"
+  name = db.Column(db.String(64), primary_key=True)
+  value = db.Column(db.DateTime, nullable=False)
+
+
+class Job(db.Model):
+  # background work queue, see jobs.py
+  __tablename__ = "Job"
+  id = db.Column(db.Integer, primary_key=True)
+  kind = db.Column(db.String(64), nullable=False)
+  payload = db.Column(db.Text, nullable=False)
+  # idempotency key: a job is not queued again while one with the same
+  # key is kept (until `flask jobs purge`)
+  key = db.Column(db.String(255), unique=True)
+  status = db.Column(db.String(16), nullable=False, default="queued", server_default="queued")
+  attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+  max_attempts = db.Column(db.Integer, nullable=False)
+  run_at = db.Column(db.DateTime, nullable=False)
+  locked_at = db.Column(db.DateTime)
+  locked_by = db.Column(db.String(120))
+  last_error = db.Column(db.Text)
+  result = db.Column(db.Text)
+  created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+  finished_at = db.Column(db.DateTime)
+
+  __table_args__ = (
+    db.Index("ix_Job_status_run_at", "status", "run_at"),
+  )
+
+
 class Show(db.Model):
+  # On Postgres partitioned by month of start_time (see partitions.py); the
+  # table's primary key is then (id, start_time), ids stay unique.
   __tablename__ = "Show"
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'),
         nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'),
         nullable=False)
-  start_time = db.Column(db.DateTime, nullable=False)
+  start_time = db.Column(db.DateTime, nullable=False, index=True)
+  # the show occupies [start_time, end_time); see scheduling.py
+  end_time = db.Column(db.DateTime, nullable=False)
+  updated_at = db.Column(db.DateTime, nullable=False, index=True,
+        server_default=func.now(), onupdate=func.now())
+
+  __table_args__ = (
+    db.Index("ix_Show_venue_id_start_time", "venue_id", "start_time"),
+    db.Index("ix_Show_artist_id_start_time", "artist_id", "start_time"),
+    db.CheckConstraint("end_time >= start_time", name="ck_Show_end_time"),
+  )
 
   def venue_shows(self):
     artist = self.artist 
@@ -171,6 +342,7 @@ class Show(db.Model):
       "artist_id": artist.id,
       "artist_name": artist.name,
       "artist_image_link": artist.image_link,
+      "artist_updated_at": artist.updated_at,
       "start_time": self.start_time
     }
 
@@ -180,6 +352,7 @@ class Show(db.Model):
       "venue_id": venue.id,
       "venue_name": venue.name,
       "venue_image_link": venue.image_link,
+      "venue_updated_at": venue.updated_at,
       "start_time": self.start_time
     }
 
@@ -195,23 +368,46 @@ class Show(db.Model):
     return d
 
 
+# one row per city, looked up case-insensitively; also the (name, id)
+# artist keyset order, a missing name sorting as ""
+db.Index("ix_City_lower_name_state", func.lower(City.name), City.state, unique=True)
+db.Index("ix_Artist_sort_name_id", func.coalesce(Artist.name, literal_column("''")), Artist.id)
+
+
 # avoid recursive import 
 from forms import *
+from queries import *
+import search
+import counters
+import scheduling
+import exporter
+import geo
+import jobs
+import commands
+from api import api
+app.register_blueprint(api)
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['timezone'] = state_timezone
+
+def parse_date_arg(name):
+  value = request.args.get(name)
+  if not value:
+    return None
+  try:
+    return dateutil.parser.parse(value)
+  except (ValueError, OverflowError):
+    return None
+
+def stream_template(template_name, **context):
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.stream(context)))
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -226,26 +422,29 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@db.read_only
 def venues():
-  data = [c.show_venue() for c in City.query.order_by(City.name).all() if c.show_venue() is not None]
-  return render_template('pages/venues.html', areas=data)
+  genre = request.args.get("genre")
+  return render_cached(
+    f"venues:index:{genre or ''}",
+    lambda: (venue_areas(genre=genre), ["venues"]),
+    lambda data: render_template('pages/venues.html', areas=data)
+  )
 
 @app.route('/venues/search', methods=['POST'])
+@db.read_only
 def search_venues():
   term = request.form.get("search_term", "")
-  data = [item.show_venues() for item in Venue.query.filter(Venue.name.ilike(f"%{term}%")).all() if item.show_venues is not None]
-  response={
-    "count": len(data),
-    "data": data
-  }
+  response = search.search_venues(term)
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@db.read_only
 def show_venue(venue_id):
-  data = Venue.query.filter(Venue.id == venue_id).first() 
-  if data:
-    data = data.get_venue()
-  return render_template('pages/show_venue.html', venue=data)
+  return render_cached(
+    f"venue:{venue_id}", lambda: venue_entry(venue_id),
+    lambda data: render_template('pages/show_venue.html', venue=data)
+  )
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -260,7 +459,7 @@ def create_venue_submission():
   venue = Venue() 
   has_error = False 
   try:
-    venue.genres = ",".join(request.form.getlist("genres"))
+    venue.genres = Genre.resolve(request.form.getlist("genres"))
     form = request.form.to_dict()
     venue.name = form.get("name")
     venue.address = form.get("address")
@@ -275,19 +474,18 @@ def create_venue_submission():
       venue.seeking_talent = True
     venue.seeking_description = form.get("seeking_description")
     venue.image_link = form.get("image_link")
-    city = form.get("city", "")
-    city_from_db = City.query.filter(City.name.ilike(f"{city.lower()}")).first() 
-    if city_from_db is not None:
-      venue.city_id = city_from_db.id
-    else:
-      c = City() 
-      c.name = city
-      c.state = form.get("state")
-      db.session.add(c)
-      db.session.commit() 
-      venue.city_id = c.id
+    venue.city_id, _ = City.resolve(form.get("city", ""), form.get("state"))
+    geo.place(venue)
     db.session.add(venue)
+    db.session.flush()
+    # slow follow-up work runs in `flask worker`, queued in this transaction
+    if venue.latitude is None:
+      jobs.enqueue("geo.locate_city", {"city_id": venue.city_id}, key=f"geo.locate_city:{venue.city_id}")
+    if venue.image_link:
+      jobs.enqueue("links.check", {"kind": "venue", "id": venue.id})
     db.session.commit()
+    venue_choices.invalidate()
+    cache.invalidate("venues")
   except:
     db.session.rollback()
     has_error = True 
@@ -312,8 +510,13 @@ def delete_venue(venue_id):
   if id is not None:
     venue = Venue.query.filter(Venue.id == id).first() 
     if venue is not None:
+      artist_ids = set(show.artist_id for show in venue.shows)
       db.session.delete(venue)
+      # the artists' past/upcoming counts catch up in the worker
+      jobs.enqueue("counters.recount", {"venue_ids": [], "artist_ids": sorted(artist_ids)})
       db.session.commit()
+      venue_choices.invalidate()
+      cache.invalidate("venues", f"venue:{id}", "shows")
       return jsonify({"success": True, "deleted": id})
   return jsonify({"success": False})
 
@@ -321,26 +524,36 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@db.read_only
 def artists():
-  data = [art.show_artists() for art in Artist.query.order_by(Artist.name).all()]
-  return render_template('pages/artists.html', artists=data)
+  per_page = request.args.get("per_page", app.config["ARTISTS_PER_PAGE"], type=int)
+  per_page = max(1, min(per_page, app.config["ARTISTS_MAX_PER_PAGE"]))
+  build = lambda: (artist_page(
+    after=request.args.get("after"),
+    before=request.args.get("before"),
+    per_page=per_page,
+    genre=request.args.get("genre")
+  ), ["artists"])
+  return render_cached(
+    "artists:index:" + request.query_string.decode(), build,
+    lambda page: render_template('pages/artists.html', artists=page["artists"],
+      next_cursor=page["next_cursor"], prev_cursor=page["prev_cursor"])
+  )
 
 @app.route('/artists/search', methods=['POST'])
+@db.read_only
 def search_artists():
   term = request.form.get("search_term", "")
-  data = [item.show_artists() for item in Artist.query.filter(Artist.name.ilike(f"%{term}%")).all()]
-  response={
-    "count": len(data),
-    "data": data
-  }
+  response = search.search_artists(term)
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@db.read_only
 def show_artist(artist_id):
-  data = Artist.query.filter(Artist.id == artist_id).first() 
-  if data:
-    data = data.get_artist()
-  return render_template('pages/show_artist.html', artist=data)
+  return render_cached(
+    f"artist:{artist_id}", lambda: artist_entry(artist_id),
+    lambda data: render_template('pages/show_artist.html', artist=data)
+  )
 
 #  Update
 #  ----------------------------------------------------------------
@@ -360,22 +573,18 @@ def edit_artist_submission(artist_id):
     genres = request.form.getlist("genres")
     form = request.form.to_dict() 
     artist.name = form.get("name")
-    city = form.get("city", "")
-    city_from_db = City.query.filter(City.name.ilike(f"{city.lower()}")).first() 
-    if city_from_db is not None:
-      artist.city = city_from_db.name
-    else:
-      c = City() 
-      c.name = city
-      c.state = form.get("state")
-      db.session.add(c)
-      db.session.commit() 
-      artist.city = c.name
+    _, artist.city = City.resolve(form.get("city", ""), form.get("state"))
     artist.state = form.get("state")
     artist.phone = form.get("phone")
-    artist.genres = ",".join(genres)
+    genres = Genre.resolve(genres)
+    if set(genres) != set(artist.genres):
+      # the association rows alone leave the Artist row untouched
+      artist.updated_at = func.now()
+    artist.genres = genres
     artist.facebook_link = form.get("facebook_link")
     db.session.commit()
+    artist_choices.invalidate()
+    cache.invalidate("artists", f"artist:{artist_id}", "shows")
     return redirect(url_for("artists"))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
@@ -390,25 +599,20 @@ def edit_venue_submission(venue_id):
   if not venue:
     return redirect(url_for('show_venue', venue_id=venue_id))
   if venue is not None:
-    venue.genres = ",".join(request.form.getlist("genres"))
+    venue.genres = Genre.resolve(request.form.getlist("genres"))
     form = request.form.to_dict()
     venue.name = form.get("name")
     venue.address = form.get("address")
     venue.state = form.get("state")
     venue.phone = form.get("phone")
     venue.facebook_link = form.get("facebook_link")
-    city = form.get("city", "")
-    city_from_db = City.query.filter(City.name.ilike(f"{city.lower()}")).first() 
-    if city_from_db is not None:
-      venue.city_id = city_from_db.id
-    else:
-      c = City() 
-      c.name = city
-      c.state = form.get("state")
-      db.session.add(c)
-      db.session.commit() 
-      venue.city_id = c.id
+    venue.city_id, _ = City.resolve(form.get("city", ""), form.get("state"))
+    geo.place(venue)
+    if venue.latitude is None:
+      jobs.enqueue("geo.locate_city", {"city_id": venue.city_id}, key=f"geo.locate_city:{venue.city_id}")
     db.session.commit()
+    venue_choices.invalidate()
+    cache.invalidate("venues", f"venue:{venue_id}", "shows")
     return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -424,7 +628,7 @@ def create_artist_submission():
   artist = Artist() 
   has_error = False 
   try:
-    artist.genres = ",".join(request.form.getlist("genres"))
+    artist.genres = Genre.resolve(request.form.getlist("genres"))
     form = request.form.to_dict()
     artist.name = form.get("name")
     artist.state = form.get("state")
@@ -438,19 +642,14 @@ def create_artist_submission():
       artist.seeking_venue = True
     artist.seeking_description = form.get("seeking_description")
     artist.image_link = form.get("image_link")
-    city = form.get("city", "")
-    city_from_db = City.query.filter(City.name.ilike(f"{city.lower()}")).first() 
-    if city_from_db is not None:
-      artist.city = city_from_db.name
-    else:
-      c = City() 
-      c.name = city
-      c.state = form.get("state")
-      db.session.add(c)
-      db.session.commit() 
-      artist.city = c.name
+    _, artist.city = City.resolve(form.get("city", ""), form.get("state"))
     db.session.add(artist)
+    db.session.flush()
+    if artist.image_link:
+      jobs.enqueue("links.check", {"kind": "artist", "id": artist.id})
     db.session.commit()
+    artist_choices.invalidate()
+    cache.invalidate("artists")
   except:
     db.session.rollback()
     has_error = True 
@@ -471,9 +670,20 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@db.read_only
 def shows():
-  data = [item.make_show() for item in Show.query.order_by(Show.id).all()]
-  return render_template('pages/shows.html', shows=data)
+  feed = show_feed(
+    start=parse_date_arg("from"),
+    end=parse_date_arg("to"),
+    venue_id=request.args.get("venue_id", type=int),
+    artist_id=request.args.get("artist_id", type=int),
+    after=request.args.get("after", type=int),
+    per_page=app.config["SHOWS_PER_PAGE"]
+  )
+  return conditional(
+    "shows:" + request.query_string.decode(), ["shows"],
+    lambda: stream_template('pages/shows.html', shows=feed)
+  )
 
 @app.route('/shows/create')
 def create_shows():
@@ -481,30 +691,220 @@ def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
+@app.route('/shows/options/<any(artists, venues):kind>')
+@db.read_only
+def show_form_options(kind):
+  # typeahead source for the show form once the select lists get too long
+  model = Artist if kind == "artists" else Venue
+  term = request.args.get("q", "").strip()
+  limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+  query = db.session.query(model.id, model.name)
+  if term:
+    # a prefix of lower(name), served by ix_*_lower_name_prefix; the
+    # user's % and _ are matched literally
+    prefix = term.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    query = query.filter(func.lower(model.name).like(prefix + "%", escape="\\"))
+  rows = query.order_by(model.name).limit(limit).all()
+  return jsonify({"data": [{"id": id, "name": name} for id, name in rows]})
+
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   show = Show() 
   has_error = False 
+  clashes = None
   try:
     form = request.form.to_dict() 
     show.artist_id = form.get("artist_id")
     show.venue_id = form.get("venue_id")
-    show.start_time = form.get("start_time")
-    db.session.add(show)
-    db.session.commit()
-  except:
+    show.start_time = dateutil.parser.parse(form.get("start_time"))
+    show.end_time = scheduling.end_time(show.start_time, int(form.get("duration") or 0))
+    scheduling.lock([show.venue_id], [show.artist_id])
+    clashes = scheduling.conflicts(show.venue_id, show.artist_id, show.start_time, show.end_time)
+    if clashes:
+      has_error = True
+    else:
+      db.session.add(show)
+      counters.show_created(show.venue_id, show.artist_id, show.start_time)
+      db.session.commit()
+      cache.invalidate("shows", "venues", "artists",
+        f"venue:{form.get('venue_id')}", f"artist:{form.get('artist_id')}")
+  except Exception as error:
     has_error = True
     db.session.rollback() 
+    if scheduling.is_conflict(error):
+      # lost a race the check above could not see
+      clashes = {"venue or artist": True}
   finally: 
     db.session.close() 
   if not has_error:
     flash('Show was successfully listed!')
     return redirect(url_for("index"))
+  elif clashes:
+    flash(f"The {' and the '.join(clashes)} already have a show at that time. Show could not be listed.")
+    return redirect(url_for("create_shows"))
   else:
     flash('An error occurred. Show could not be listed.')
     return redirect(url_for("create_shows"))
   return render_template('pages/home.html')
 
+@app.route('/venues/<int:venue_id>/availability')
+@db.read_only
+def venue_availability(venue_id):
+  # free/busy of one venue; ?from=&to= default to the coming week
+  start = scheduling.naive(parse_date_arg("from") or datetime.today())
+  end = scheduling.naive(parse_date_arg("to") or start + timedelta(days=7))
+  if end <= start or end - start > timedelta(days=app.config["AVAILABILITY_MAX_DAYS"]):
+    return jsonify({"error": f"to must be after from and at most {app.config['AVAILABILITY_MAX_DAYS']} days later"}), 400
+  if db.session.query(Venue.id).filter(Venue.id == venue_id).first() is None:
+    return jsonify({"error": "not found"}), 404
+  busy, free = scheduling.availability(venue_id, start, end)
+  return jsonify({
+    "venue_id": venue_id,
+    "from": start.isoformat(),
+    "to": end.isoformat(),
+    "busy": [{"show_id": id, "start": s.isoformat(), "end": e.isoformat()} for s, e, id in busy],
+    "free": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in free],
+  })
+
+@app.route('/venues/<int:venue_id>/recommendations')
+@db.read_only
+def venue_recommendations(venue_id):
+  # seeking artists ranked for this venue; optional numpy/scipy
+  try:
+    import recommend
+  except ImportError:
+    return jsonify({"error": "recommendations need numpy and scipy"}), 501
+  limit = request.args.get("limit", app.config["RECOMMEND_LIMIT"], type=int)
+  try:
+    ranked = recommend.for_venue(venue_id, limit=max(1, min(limit, app.config["RECOMMEND_MAX_LIMIT"])))
+  except recommend.NotReady:
+    return jsonify({"error": "recommendations are being prepared"}), 503, {"Retry-After": "5"}
+  if ranked is None:
+    return jsonify({"error": "not found"}), 404
+  artists = dict((row.id, row) for row in db.session.query(
+    Artist.id, Artist.name, Artist.image_link, Artist.city, Artist.state, Artist.seeking_description
+  ).filter(Artist.id.in_([id for id, _, _ in ranked])))
+  return jsonify({
+    "venue_id": venue_id,
+    "data": [{
+      "artist_id": id,
+      "artist_name": artists[id].name,
+      "artist_image_link": artists[id].image_link,
+      "city": artists[id].city,
+      "state": artists[id].state,
+      "seeking_description": artists[id].seeking_description,
+      "score": round(score, 4),
+      "scores": parts,
+    } for id, score, parts in ranked if id in artists]
+  })
+
+#  Calendar
+#  ----------------------------------------------------------------
+
+@app.route('/cities/<int:city_id>/calendar')
+@db.read_only
+def city_calendar_view(city_id):
+  # ?month=YYYY-MM, the current month by default
+  try:
+    month = datetime.strptime(request.args.get("month", ""), "%Y-%m").date()
+  except ValueError:
+    month = datetime.today().date().replace(day=1)
+  return render_cached(
+    f"city:{city_id}:calendar:{month:%Y-%m}",
+    lambda: (city_calendar(city_id, month), ["shows", "venues", "artists", f"city:{city_id}"]),
+    lambda data: render_template('pages/calendar.html', calendar=data) if data else not_found_error(None)
+  )
+
+#  Nearby
+#  ----------------------------------------------------------------
+
+def nearby_args():
+  # -> (lat, lng, radius_km, limit), or raises ValueError
+  lat = request.args.get("lat", type=float)
+  lng = request.args.get("lng", type=float)
+  if lat is None or lng is None or not -90 <= lat <= 90 or not -180 <= lng <= 180:
+    raise ValueError("lat and lng are required")
+  radius = request.args.get("radius_km", app.config["NEARBY_RADIUS_KM"], type=float)
+  if not 0 < radius <= app.config["NEARBY_MAX_RADIUS_KM"]:
+    raise ValueError(f"radius_km must be between 0 and {app.config['NEARBY_MAX_RADIUS_KM']}")
+  limit = request.args.get("limit", app.config["NEARBY_LIMIT"], type=int)
+  return lat, lng, radius, max(1, min(limit, app.config["NEARBY_MAX_LIMIT"]))
+
+def nearby_venue(distance, row):
+  return {
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+    "latitude": row.latitude,
+    "longitude": row.longitude,
+    "distance_km": round(distance, 2),
+  }
+
+@app.route('/venues/nearby')
+@db.read_only
+def venues_nearby():
+  try:
+    lat, lng, radius, limit = nearby_args()
+  except ValueError as error:
+    return jsonify({"error": str(error)}), 400
+  venues = geo.nearby_venues(lat, lng, radius, limit=limit)
+  return jsonify({"data": [nearby_venue(distance, row) for distance, row in venues]})
+
+@app.route('/shows/nearby')
+@db.read_only
+def shows_nearby():
+  # ?from=&to= default to tonight: now until 6am tomorrow
+  try:
+    lat, lng, radius, limit = nearby_args()
+  except ValueError as error:
+    return jsonify({"error": str(error)}), 400
+  start = scheduling.naive(parse_date_arg("from") or datetime.today())
+  end = parse_date_arg("to")
+  if end is None:
+    end = datetime.combine(start.date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=6)
+  end = scheduling.naive(end)
+  shows = geo.nearby_shows(lat, lng, radius, start, end, limit=limit)
+  return jsonify({
+    "from": start.isoformat(),
+    "to": end.isoformat(),
+    "data": [{
+      "id": show.id,
+      "artist_id": show.artist_id,
+      "artist_name": show.artist_name,
+      "start_time": show.start_time.isoformat(),
+      "end_time": show.end_time.isoformat(),
+      "venue": nearby_venue(distance, venue),
+    } for distance, venue, show in shows]
+  })
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):kind>.<any(csv, jsonl):fmt>')
+@db.read_only
+def export(kind, fmt):
+  # chunked response straight off a server-side cursor
+  rows = exporter.iter_rows(
+    kind, since=parse_date_arg("since"),
+    after_id=request.args.get("after_id", type=int)
+  )
+  mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+  response = Response(stream_with_context(exporter.WRITERS[fmt](kind, rows)), mimetype=mimetype)
+  response.headers["Content-Disposition"] = f"attachment; filename={kind}.{fmt}"
+  return response
+
+@app.route('/_status/pools')
+def pool_status():
+  # per process, so it has to be asked over HTTP; operators only
+  token = app.config.get("POOL_STATUS_TOKEN")
+  if not token:
+    abort(404)
+  given = request.headers.get("Authorization", "")
+  if not hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+    abort(404)
+  return jsonify(db.pool_stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
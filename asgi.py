@@ -0,0 +1,248 @@
+"""ASGI entry point.
+
+The read-only pages (venue/artist listings and detail pages, /shows and
+both searches) are answered by async handlers; everything else goes to
+the Flask app through a thread-pooled WSGI bridge.
+
+    pip install a2wsgi uvicorn
+    uvicorn asgi:application --workers 4
+
+The ASGI mode is optional: a2wsgi and uvicorn are not in requirements.txt
+and only this module needs them.
+
+The handlers build pages with the same query functions, cache keys, tags
+and templates as the Flask views. Everything that blocks (queries, cache
+backend calls, rendering) runs in a thread pool sized like the database
+pool, so the event loop only parses requests and moves bytes.
+"""
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from a2wsgi import WSGIMiddleware
+from flask import request, session, render_template, make_response
+from app import app, db, parse_date_arg
+from cache import render_cached, conditional
+from queries import venue_areas, venue_entry, artist_page, artist_entry, show_feed
+import search
+
+wsgi = WSGIMiddleware(app)
+
+# one thread per database connection the pool can hand out
+executor = ThreadPoolExecutor(
+  max_workers=app.config.get("DB_POOL_SIZE", 5) + app.config.get("DB_MAX_OVERFLOW", 10),
+  thread_name_prefix="asgi",
+)
+
+#----------------------------------------------------------------------------#
+# Handlers. Called in a worker thread inside a Flask request context.
+#----------------------------------------------------------------------------#
+
+class Page(object):
+  # cached pages: build -> (value, tags), shared with the sync cache entries
+  # conditional pages: tags given up front, build -> value
+  # uncached pages: no key, build -> value
+  def __init__(self, key, build, render, tags=None):
+    self.key = key
+    self.build = build
+    self.render = render
+    self.tags = tags
+
+  def respond(self):
+    if self.tags is not None:
+      return conditional(self.key, self.tags, lambda: make_response(self.render(self.build())))
+    if self.key is None:
+      return make_response(self.render(self.build()))
+    return render_cached(self.key, self.build, self.render)
+
+
+def venues():
+  genre = request.args.get("genre")
+  return Page(
+    f"venues:index:{genre or ''}",
+    lambda: (venue_areas(genre=genre), ["venues"]),
+    lambda data: render_template('pages/venues.html', areas=data)
+  )
+
+
+def show_venue(venue_id):
+  return Page(
+    f"venue:{venue_id}",
+    lambda: venue_entry(venue_id),
+    lambda data: render_template('pages/show_venue.html', venue=data)
+  )
+
+
+def artists():
+  per_page = request.args.get("per_page", app.config["ARTISTS_PER_PAGE"], type=int)
+  per_page = max(1, min(per_page, app.config["ARTISTS_MAX_PER_PAGE"]))
+  after, before, genre = request.args.get("after"), request.args.get("before"), request.args.get("genre")
+  return Page(
+    "artists:index:" + request.query_string.decode(),
+    lambda: (artist_page(after=after, before=before, per_page=per_page, genre=genre), ["artists"]),
+    lambda page: render_template('pages/artists.html', artists=page["artists"],
+      next_cursor=page["next_cursor"], prev_cursor=page["prev_cursor"])
+  )
+
+
+def show_artist(artist_id):
+  return Page(
+    f"artist:{artist_id}",
+    lambda: artist_entry(artist_id),
+    lambda data: render_template('pages/show_artist.html', artist=data)
+  )
+
+
+def shows():
+  feed = show_feed(
+    start=parse_date_arg("from"),
+    end=parse_date_arg("to"),
+    venue_id=request.args.get("venue_id", type=int),
+    artist_id=request.args.get("artist_id", type=int),
+    after=request.args.get("after", type=int),
+    per_page=app.config["SHOWS_PER_PAGE"]
+  )
+  # the feed is lazy: its query runs while the template renders
+  return Page(
+    "shows:" + request.query_string.decode(),
+    lambda: feed,
+    lambda feed: render_template('pages/shows.html', shows=feed),
+    tags=["shows"]
+  )
+
+
+def _search_page(find, template):
+  term = request.form.get("search_term", "")
+  return Page(
+    None,
+    lambda: find(term),
+    lambda results: render_template(template, results=results, search_term=term)
+  )
+
+
+def search_venues():
+  return _search_page(search.search_venues, 'pages/search_venues.html')
+
+
+def search_artists():
+  return _search_page(search.search_artists, 'pages/search_artists.html')
+
+
+ROUTES = [
+  ("GET", re.compile(r"^/venues$"), venues),
+  ("POST", re.compile(r"^/venues/search$"), search_venues),
+  ("GET", re.compile(r"^/venues/(?P<venue_id>\d+)$"), show_venue),
+  ("GET", re.compile(r"^/artists$"), artists),
+  ("POST", re.compile(r"^/artists/search$"), search_artists),
+  ("GET", re.compile(r"^/artists/(?P<artist_id>\d+)$"), show_artist),
+  ("GET", re.compile(r"^/shows$"), shows),
+]
+
+
+def match(method, path):
+  for route_method, pattern, handler in ROUTES:
+    m = pattern.match(path)
+    if m and method == route_method:
+      return handler, dict((k, int(v)) for k, v in m.groupdict().items())
+  return None, None
+
+#----------------------------------------------------------------------------#
+# ASGI.
+#----------------------------------------------------------------------------#
+
+def _context(scope, body):
+  # Werkzeug 1.0 keeps contexts per thread, not per task: pushed in the
+  # worker thread only
+  headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+  return app.test_request_context(
+    scope["path"], method=scope["method"], headers=headers,
+    query_string=scope["query_string"], data=body
+  )
+
+
+async def _read_body(receive):
+  body, more = b"", True
+  while more:
+    message = await receive()
+    if message["type"] == "http.disconnect":
+      break
+    body += message.get("body", b"")
+    more = message.get("more_body", False)
+  return body
+
+
+def _replay(body, receive):
+  sent = False
+  async def replayed():
+    nonlocal sent
+    if not sent:
+      sent = True
+      return {"type": "http.request", "body": body, "more_body": False}
+    return await receive()
+  return replayed
+
+
+async def _send(send, response):
+  await send({
+    "type": "http.response.start",
+    "status": response.status_code,
+    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response.headers],
+  })
+  await send({"type": "http.response.body", "body": response.get_data()})
+
+
+def _respond(scope, body, handler, params):
+  # -> a response, or None to pass the request on to the WSGI app. Runs
+  # the app's before/after request hooks (profiling, replica pinning,
+  # the session) like Flask's own dispatch; teardown runs when the
+  # context is popped.
+  try:
+    with _context(scope, body):
+      # flashes are shown and cleared by the WSGI app, which saves the session
+      if "_flashes" in session:
+        return None
+      try:
+        response = app.preprocess_request()
+        if response is None:
+          db.use_replica()
+          response = handler(**params).respond()
+      except Exception as error:
+        try:
+          response = app.handle_user_exception(error)
+        except Exception:
+          # unhandled: the WSGI app runs the request again and answers it
+          # with its error handling (500 page, logging, debugger)
+          return None
+      return app.process_response(app.make_response(response))
+  finally:
+    db.session.remove()
+
+
+async def serve(scope, receive, send, handler, params):
+  body = await _read_body(receive) if scope["method"] == "POST" else b""
+  loop = asyncio.get_running_loop()
+  response = await loop.run_in_executor(executor, _respond, scope, body, handler, params)
+  if response is None:
+    return await wsgi(scope, _replay(body, receive), send)
+  await _send(send, response)
+
+
+async def lifespan(receive, send):
+  while True:
+    message = await receive()
+    if message["type"] == "lifespan.startup":
+      await send({"type": "lifespan.startup.complete"})
+    elif message["type"] == "lifespan.shutdown":
+      executor.shutdown(wait=True)
+      await send({"type": "lifespan.shutdown.complete"})
+      return
+
+
+async def application(scope, receive, send):
+  if scope["type"] == "lifespan":
+    return await lifespan(receive, send)
+  handler = None
+  if scope["type"] == "http":
+    handler, params = match(scope["method"], scope["path"])
+  if handler is None:
+    return await wsgi(scope, receive, send)
+  await serve(scope, receive, send, handler, params)
@@ -0,0 +1,167 @@
+"""Per-controller micro-benchmarks: p50/p95 latency, queries per request
+and peak allocations, run in-process through the Flask test client with
+the response cache off.
+
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.controllers --shows 10000 --save baseline.json
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.controllers --compare baseline.json
+
+--compare exits non-zero when a controller's p50 or peak allocations grow
+by more than --threshold percent, or its query count grows at all.
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+import tracemalloc
+from app import app, db, Venue, Artist, Show
+from cache import cache, NullBackend
+from instrumentation import count_queries
+
+CASES = [
+  ("venues", "GET", "/venues", None),
+  ("show_venue", "GET", "/venues/{venue_id}", None),
+  ("artists", "GET", "/artists", None),
+  ("show_artist", "GET", "/artists/{artist_id}", None),
+  ("shows", "GET", "/shows", None),
+  ("venues_nearby", "GET", "/venues/nearby?lat={lat}&lng={lng}", None),
+  ("shows_nearby", "GET", "/shows/nearby?lat={lat}&lng={lng}", None),
+  ("recommendations", "GET", "/venues/{venue_id}/recommendations", None),
+  ("search_venues", "POST", "/venues/search", {"search_term": "ka"}),
+  ("search_artists", "POST", "/artists/search", {"search_term": "ka"}),
+]
+
+
+def _params():
+  # the venue and artist with the most shows: the worst detail pages
+  busiest = lambda column: db.session.query(column).group_by(column) \
+    .order_by(db.func.count(Show.id).desc(), column).limit(1).scalar()
+  venue_id = busiest(Show.venue_id)
+  # searched from the busiest venue's location
+  lat, lng = db.session.query(Venue.latitude, Venue.longitude).filter(Venue.id == venue_id).first() or (None, None)
+  return {
+    "venue_id": venue_id, "artist_id": busiest(Show.artist_id),
+    "lat": 0.0 if lat is None else lat, "lng": 0.0 if lng is None else lng,
+  }
+
+
+def _request(client, method, path, data):
+  response = client.open(path, method=method, data=data)
+  # streamed bodies render while being read
+  response.get_data()
+  if response.status_code >= 400:
+    raise RuntimeError(f"{method} {path}: {response.status_code}")
+
+
+def measure(client, method, path, data, repeat, warmup):
+  for _ in range(warmup):
+    _request(client, method, path, data)
+  samples = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    _request(client, method, path, data)
+    samples.append((time.perf_counter() - start) * 1000)
+
+  # queries and allocations from one separate run, so neither tracemalloc
+  # nor the counter skews the timings
+  with count_queries() as counter:
+    tracemalloc.start()
+    try:
+      _request(client, method, path, data)
+      _, peak = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+
+  samples.sort()
+  return {
+    "p50_ms": round(statistics.median(samples), 3),
+    "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+    "queries": counter.count,
+    "peak_kib": round(peak / 1024.0, 1),
+  }
+
+
+def run(cases, repeat, warmup):
+  params = _params()
+  client = app.test_client()
+  if any(case[0] == "recommendations" for case in cases):
+    # requests answer 503 until the first model is built
+    import recommend
+    recommend.warm()
+  results = {}
+  for name, method, path, data in cases:
+    results[name] = measure(client, method, path.format(**params), data, repeat, warmup)
+    r = results[name]
+    print(f"  {name:<16} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+          f"{r['queries']:>4} queries  {r['peak_kib']:>9.1f} KiB peak")
+  return results
+
+
+def compare(baseline, results, threshold):
+  # -> list of human-readable regressions
+  regressions = []
+  for name, current in results.items():
+    before = baseline.get(name)
+    if before is None:
+      continue
+    for key in ("p50_ms", "peak_kib"):
+      limit = before[key] * (1 + threshold / 100.0)
+      if current[key] > limit:
+        regressions.append(f"{name}: {key} {before[key]} -> {current[key]} "
+                           f"(+{(current[key] / max(before[key], 1e-9) - 1) * 100:.0f}%)")
+    if current["queries"] > before["queries"]:
+      regressions.append(f"{name}: queries {before['queries']} -> {current['queries']}")
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--shows", type=int, default=10000, help="seed this many shows if the database is empty")
+  parser.add_argument("--repeat", type=int, default=30)
+  parser.add_argument("--warmup", type=int, default=3)
+  parser.add_argument("--only", action="append", help="repeatable; controller names")
+  parser.add_argument("--save", metavar="FILE", help="write the results as a baseline")
+  parser.add_argument("--compare", metavar="FILE", help="fail on regressions against a saved baseline")
+  parser.add_argument("--threshold", type=float, default=20.0, help="allowed growth in percent")
+  args = parser.parse_args()
+
+  cases = [c for c in CASES if not args.only or c[0] in args.only]
+  app.logger.getChild("perf").setLevel(logging.ERROR)
+  cache.backend = NullBackend()
+
+  with app.app_context():
+    db.create_all()
+    if Show.query.first() is None:
+      from benchmarks.seed import seed
+      start = time.perf_counter()
+      counts = seed(shows=args.shows)
+      print(f"seeded {counts} in {time.perf_counter() - start:.1f}s")
+    meta = {
+      "dialect": db.engine.dialect.name,
+      "shows": Show.query.count(),
+      "venues": Venue.query.count(),
+      "artists": Artist.query.count(),
+    }
+    print(f"== {meta['dialect']}, {meta['shows']} shows, {meta['venues']} venues, {meta['artists']} artists")
+    results = run(cases, args.repeat, args.warmup)
+
+  if args.save:
+    with open(args.save, "w") as f:
+      json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+  if args.compare:
+    with open(args.compare) as f:
+      baseline = json.load(f)
+    if baseline["meta"] != meta:
+      print(f"warning: baseline was taken on {baseline['meta']}", file=sys.stderr)
+    regressions = compare(baseline["results"], results, args.threshold)
+    if regressions:
+      print("== regressions")
+      for line in regressions:
+        print("  " + line)
+      sys.exit(1)
+    print(f"== no regressions beyond {args.threshold:.0f}%")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,56 @@
+"""Per-call cost of the show time formatting at page scale.
+
+    python -m benchmarks.formatting --shows 5000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+from formatting import FORMATS, format_datetime
+
+
+def legacy(value, format="medium"):
+  # the filter as it was: a string round trip and an uncached pattern
+  date = dateutil.parser.parse(str(value))
+  return babel.dates.format_datetime(date, FORMATS[format])
+
+
+CASES = [
+  ("strftime (old tiles)", lambda v: v.strftime('%A %B, %d, %I at %p')),
+  ("dateutil + babel (old filter)", lambda v: legacy(v, "tile")),
+  ("babel.dates.format_datetime", lambda v: babel.dates.format_datetime(v, FORMATS["tile"])),
+  ("format_datetime", lambda v: format_datetime(v, "tile")),
+  ("format_datetime, venue zone", lambda v: format_datetime(v, "tile_tz", tz="America/Chicago")),
+]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--shows", type=int, default=5000, help="tiles per page")
+  parser.add_argument("--repeat", type=int, default=7)
+  args = parser.parse_args()
+
+  rng = random.Random(0)
+  origin = datetime(2020, 1, 1)
+  values = [origin + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)) for _ in range(args.shows)]
+
+  baseline = None
+  for name, fn in CASES:
+    fn(values[0])
+    pages = []
+    for _ in range(args.repeat):
+      start = time.perf_counter()
+      for value in values:
+        fn(value)
+      pages.append(time.perf_counter() - start)
+    page = statistics.median(pages)
+    baseline = baseline or page
+    print(f"  {name:<32} {page * 1e6 / len(values):8.2f} us/call  "
+          f"{page * 1000:8.2f} ms/page  {page / baseline:5.2f}x")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,112 @@
+"""Closed-loop load test: N concurrent clients request the read-only pages
+for a fixed time against one or more running servers, e.g. the WSGI and
+the ASGI deployment of the same database side by side.
+
+    gunicorn -w 4 -b 127.0.0.1:8000 app:app
+    uvicorn asgi:application --workers 4 --port 8001
+    python -m benchmarks.load http://127.0.0.1:8000 http://127.0.0.1:8001 --concurrency 64
+
+Paths default to the listing pages plus a sample of detail pages.
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+PATHS = ["/venues", "/artists", "/shows", "/venues/{venue_id}", "/artists/{artist_id}"]
+SEARCH = {"/venues/search": "search_term", "/artists/search": "search_term"}
+
+
+def _request(base, path, terms, rng):
+  data = None
+  if path in SEARCH:
+    data = urllib.parse.urlencode({SEARCH[path]: rng.choice(terms)}).encode()
+  else:
+    path = path.format(venue_id=rng.randint(1, 100), artist_id=rng.randint(1, 100))
+  start = time.perf_counter()
+  try:
+    with urllib.request.urlopen(base + path, data=data, timeout=30) as response:
+      response.read()
+      ok = response.status < 500
+  except urllib.error.HTTPError as e:
+    ok = e.code < 500
+  except (urllib.error.URLError, OSError):
+    ok = False
+  return time.perf_counter() - start, ok
+
+
+def run(base, paths, terms, concurrency, duration, seed):
+  samples, errors = [], [0]
+  lock = threading.Lock()
+  deadline = time.perf_counter() + duration
+
+  def client(i):
+    rng = random.Random(seed + i)
+    while time.perf_counter() < deadline:
+      elapsed, ok = _request(base, rng.choice(paths), terms, rng)
+      with lock:
+        samples.append(elapsed)
+        if not ok:
+          errors[0] += 1
+
+  threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+  started = time.perf_counter()
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  wall = time.perf_counter() - started
+  samples.sort()
+  pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000 if samples else 0.0
+  return {
+    "requests": len(samples),
+    "errors": errors[0],
+    "rps": len(samples) / wall,
+    "p50": pick(0.50),
+    "p95": pick(0.95),
+    "p99": pick(0.99),
+    "mean": statistics.mean(samples) * 1000 if samples else 0.0,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("servers", nargs="+", help="base URLs, e.g. http://127.0.0.1:8000")
+  parser.add_argument("--path", action="append", dest="paths", help="repeatable; defaults to the listing and detail pages")
+  parser.add_argument("--search", action="store_true", help="include the search POSTs")
+  parser.add_argument("--term", action="append", dest="terms", default=None)
+  parser.add_argument("--concurrency", type=int, default=32)
+  parser.add_argument("--duration", type=float, default=30)
+  parser.add_argument("--warmup", type=float, default=3)
+  parser.add_argument("--seed", type=int, default=1)
+  args = parser.parse_args()
+
+  paths = args.paths or list(PATHS)
+  if args.search:
+    paths += list(SEARCH)
+  terms = args.terms or ["ka", "lo", "mi", "ten", "rock", "jazz"]
+
+  results = []
+  for base in args.servers:
+    base = base.rstrip("/")
+    run(base, paths, terms, args.concurrency, args.warmup, args.seed)
+    result = run(base, paths, terms, args.concurrency, args.duration, args.seed)
+    results.append((base, result))
+    print(f"{base}: {result['requests']} requests, {result['errors']} errors, "
+          f"{result['rps']:.1f} req/s, p50 {result['p50']:.1f} ms, "
+          f"p95 {result['p95']:.1f} ms, p99 {result['p99']:.1f} ms")
+
+  if len(results) > 1:
+    (base_url, base), others = results[0], results[1:]
+    print("== relative to " + base_url)
+    for url, result in others:
+      print(f"  {url}: {result['rps'] / max(base['rps'], 1e-9):.2f}x throughput, "
+            f"p95 {result['p95'] / max(base['p95'], 1e-9):.2f}x")
+
+
+if __name__ == "__main__":
+  main()
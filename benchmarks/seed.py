@@ -0,0 +1,174 @@
+"""Seeded synthetic data at any scale (1k to 10M shows); rows are
+generated lazily and inserted in batches, so memory stays flat.
+
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.seed --shows 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from app import app, db, City, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from helper import GENRES, STATES
+import counters
+import geo
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "vo", "shi", "an", "del", "or", "po", "zu"]
+
+
+def _name(rng, words=2):
+  return " ".join(
+    "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+    for _ in range(words)
+  )
+
+
+def _insert(table, rows, batch_size):
+  # executemany in fixed-size batches so memory does not grow with scale
+  rows = iter(rows)
+  while True:
+    batch = list(islice(rows, batch_size))
+    if not batch:
+      break
+    db.engine.execute(table.insert(), batch)
+
+
+def _next_id(model):
+  return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _sync_sequences(tables):
+  # explicit ids do not advance Postgres serial sequences
+  if db.engine.dialect.name != "postgresql":
+    return
+  for table in tables:
+    db.engine.execute(
+      f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+      f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"))"
+    )
+
+
+def seed(shows=10000, venues=None, artists=None, cities=None, seed=0, batch_size=5000):
+  venues = venues or max(10, shows // 20)
+  artists = artists or max(10, shows // 10)
+  cities = cities or max(5, venues // 20)
+  rng = random.Random(seed)
+  # coordinates come from their own stream so the rest of the data does
+  # not change with them
+  geo_rng = random.Random(f"{seed}:geo")
+  now = datetime.today()
+
+  existing = set(name for name, in db.session.query(Genre.name))
+  _insert(Genre.__table__, ({"name": name} for name, _ in GENRES if name not in existing), batch_size)
+  genre_ids = [id for id, in db.session.query(Genre.id)]
+  states = [code for code, _ in STATES]
+
+  # (lower(name), state) is unique
+  city_start = _next_id(City)
+  keys = set(City.key(name, state) for name, state in db.session.query(City.name, City.state))
+  city_rows = []
+  while len(city_rows) < cities:
+    name, state = _name(rng, rng.randint(1, 2)), rng.choice(states)
+    if City.key(name, state) not in keys:
+      keys.add(City.key(name, state))
+      city_rows.append({
+        "id": city_start + len(city_rows), "name": name, "state": state,
+        # somewhere in the contiguous US
+        "latitude": geo_rng.uniform(25, 49), "longitude": geo_rng.uniform(-124, -67),
+      })
+  _insert(City.__table__, city_rows, batch_size)
+
+  venue_start = _next_id(Venue)
+  def venue_rows():
+    for i in range(venues):
+      city = rng.choice(city_rows)
+      # within ~15 km of the city
+      lat = city["latitude"] + geo_rng.uniform(-0.13, 0.13)
+      lng = city["longitude"] + geo_rng.uniform(-0.18, 0.18)
+      yield {
+        "id": venue_start + i,
+        "name": "The " + _name(rng),
+        "city_id": city["id"],
+        "state": city["state"],
+        "address": f"{rng.randint(1, 9999)} {_name(rng, 1)} St",
+        "phone": "326-123-5000",
+        "seeking_talent": rng.random() < 0.3,
+        "latitude": lat,
+        "longitude": lng,
+        "geohash": geo.encode(lat, lng),
+      }
+  _insert(Venue.__table__, venue_rows(), batch_size)
+  _insert(venue_genres, ({
+    "venue_id": venue_start + i, "genre_id": genre_id
+  } for i in range(venues) for genre_id in rng.sample(genre_ids, 2)), batch_size)
+
+  artist_start = _next_id(Artist)
+  def artist_rows():
+    for i in range(artists):
+      city = rng.choice(city_rows)
+      yield {
+        "id": artist_start + i,
+        "name": _name(rng),
+        "city": city["name"],
+        "state": city["state"],
+        "phone": "326-123-5000",
+        "seeking_venue": rng.random() < 0.3,
+      }
+  _insert(Artist.__table__, artist_rows(), batch_size)
+  _insert(artist_genres, ({
+    "artist_id": artist_start + i, "genre_id": genre_id
+  } for i in range(artists) for genre_id in rng.sample(genre_ids, 2)), batch_size)
+
+  # Two years of history, one year ahead, and no venue or artist booked
+  # twice (see scheduling.py): the span is cut into slots, every slot
+  # holds at most one show per venue and per artist, and a show never
+  # outlasts its slot.
+  per_slot = min(venues, artists)
+  slots = -(-shows // per_slot)
+  span = timedelta(days=3 * 365)
+  origin = now - timedelta(days=2 * 365)
+  gap = int(span.total_seconds() // slots)
+  duration = min(120 * 60, gap // 2)
+  def show_rows():
+    for slot in range(slots):
+      venue_offset, artist_offset = rng.randrange(venues), rng.randrange(artists)
+      slot_start = origin + timedelta(seconds=slot * gap)
+      for k in range(min(per_slot, shows - slot * per_slot)):
+        start_time = slot_start + timedelta(seconds=rng.randrange(gap - duration + 1))
+        yield {
+          "venue_id": venue_start + (venue_offset + k) % venues,
+          "artist_id": artist_start + (artist_offset + k) % artists,
+          "start_time": start_time,
+          "end_time": start_time + timedelta(seconds=duration),
+        }
+  _insert(Show.__table__, show_rows(), batch_size)
+
+  _sync_sequences(["City", "Venue", "Artist"])
+  counters.rebuild(now)
+  return {"cities": cities, "venues": venues, "artists": artists, "shows": shows}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--shows", type=int, default=10000)
+  parser.add_argument("--venues", type=int)
+  parser.add_argument("--artists", type=int)
+  parser.add_argument("--cities", type=int)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--batch-size", type=int, default=5000)
+  args = parser.parse_args()
+
+  with app.app_context():
+    db.create_all()
+    start = time.perf_counter()
+    counts = seed(shows=args.shows, venues=args.venues, artists=args.artists,
+                  cities=args.cities, seed=args.seed, batch_size=args.batch_size)
+    print(f"seeded {counts} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,125 @@
+"""Seed a dataset and compare query plans/timings without and with the
+indexes from migration 3f804b40dc04.
+
+    DATABASE_URL=postgresql:///fyyur_bench python -m benchmarks.show_indexes --shows 1000000
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.show_indexes
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+from sqlalchemy import text
+from app import app, db
+
+INDEXES = [
+  ("Show", "ix_Show_venue_id_start_time"),
+  ("Show", "ix_Show_artist_id_start_time"),
+  ("Show", "ix_Show_start_time"),
+  ("Venue", "ix_Venue_city_id"),
+  ("Artist", "ix_Artist_sort_name_id"),
+  ("City", "ix_City_lower_name_state"),
+]
+
+QUERIES = [
+  ("venue upcoming shows",
+   'SELECT * FROM "Show" WHERE venue_id = :venue_id AND start_time >= :now'),
+  ("artist past shows",
+   'SELECT * FROM "Show" WHERE artist_id = :artist_id AND start_time < :now'),
+  ("shows in a date window",
+   'SELECT * FROM "Show" WHERE start_time >= :now ORDER BY start_time LIMIT 50'),
+  ("venues of a city",
+   'SELECT * FROM "Venue" WHERE city_id = :city_id'),
+  ("city lookup",
+   'SELECT * FROM "City" WHERE lower(name) = :city_name AND state = :state'),
+  ("artist keyset page",
+   'SELECT id, name FROM "Artist" WHERE coalesce(name, \'\') > :artist_name '
+   'OR (coalesce(name, \'\') = :artist_name AND id > :artist_id) '
+   'ORDER BY coalesce(name, \'\'), id LIMIT 50'),
+]
+
+
+def _index(table, name):
+  for index in db.metadata.tables[table].indexes:
+    if index.name == name:
+      return index
+  raise LookupError(name)
+
+
+def _params():
+  one = lambda sql: db.engine.execute(text(sql)).first()
+  venue_id, = one('SELECT venue_id FROM "Show" LIMIT 1')
+  artist_id, artist_name = one('SELECT id, name FROM "Artist" ORDER BY id LIMIT 1 OFFSET 100')
+  city_id, city_name, state = one('SELECT id, lower(name), state FROM "City" LIMIT 1')
+  return {
+    "now": datetime.today(), "venue_id": venue_id, "artist_id": artist_id,
+    "artist_name": artist_name, "city_id": city_id, "city_name": city_name, "state": state,
+  }
+
+
+def explain(sql, params):
+  if db.engine.dialect.name == "postgresql":
+    prefix = "EXPLAIN ANALYZE "
+  else:
+    prefix = "EXPLAIN QUERY PLAN "
+  rows = db.engine.execute(text(prefix + sql), params).fetchall()
+  return "\n".join("    " + " ".join(str(c) for c in row) for row in rows)
+
+
+def timed(sql, params, repeat):
+  samples = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    db.engine.execute(text(sql), params).fetchall()
+    samples.append((time.perf_counter() - start) * 1000)
+  return statistics.median(samples)
+
+
+def run(label, params, repeat):
+  print(f"== {label}")
+  results = {}
+  for name, sql in QUERIES:
+    results[name] = timed(sql, params, repeat)
+    print(f"  {name}: {results[name]:.3f} ms (median of {repeat})")
+    print(explain(sql, params))
+  return results
+
+
+def analyze():
+  db.engine.execute("ANALYZE")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--shows", type=int, default=200000)
+  parser.add_argument("--repeat", type=int, default=20)
+  parser.add_argument("--no-seed", action="store_true", help="reuse an already seeded database")
+  args = parser.parse_args()
+
+  with app.app_context():
+    db.create_all()
+    if not args.no_seed:
+      from benchmarks.seed import seed
+      start = time.perf_counter()
+      counts = seed(shows=args.shows)
+      print(f"seeded {counts} in {time.perf_counter() - start:.1f}s")
+    params = _params()
+
+    indexes = [_index(table, name) for table, name in INDEXES]
+    for index in indexes:
+      db.engine.execute(f'DROP INDEX IF EXISTS "{index.name}"')
+    analyze()
+    before = run("without indexes", params, args.repeat)
+
+    for index in indexes:
+      index.create(db.engine)
+    analyze()
+    after = run("with indexes", params, args.repeat)
+
+    print("== summary")
+    for name, _ in QUERIES:
+      print(f"  {name}: {before[name]:.3f} ms -> {after[name]:.3f} ms "
+            f"({before[name] / max(after[name], 1e-6):.1f}x)")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,284 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from flask import g, request, session, make_response, Response, has_request_context
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class NullBackend(object):
+  def get(self, key):
+    return None
+
+  def set(self, key, value, timeout=None):
+    pass
+
+  def delete(self, key):
+    pass
+
+  def incr(self, key):
+    return 0
+
+  def version(self, key):
+    return 0
+
+
+class LRUBackend(object):
+  # In-process, per-worker. Invalidation only reaches this process, so
+  # multi-worker deployments should use a shared backend.
+  def __init__(self, maxsize=1024):
+    self.maxsize = maxsize
+    self._data = OrderedDict()
+    # tag versions live outside the LRU: evicting one would reset it to 0
+    # and could make an older entry look current again
+    self._versions = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      item = self._data.get(key)
+      if item is None:
+        return None
+      value, expires = item
+      if expires is not None and expires <= time.monotonic():
+        del self._data[key]
+        return None
+      self._data.move_to_end(key)
+      return value
+
+  def set(self, key, value, timeout=None):
+    expires = time.monotonic() + timeout if timeout else None
+    with self._lock:
+      self._data[key] = (value, expires)
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+
+  def delete(self, key):
+    with self._lock:
+      self._data.pop(key, None)
+
+  def incr(self, key):
+    with self._lock:
+      value = self._versions[key] = self._versions.get(key, 0) + 1
+      return value
+
+  def version(self, key):
+    return self._versions.get(key, 0)
+
+
+class RedisBackend(object):
+  # Any client with get/set/delete/incr works (redis.Redis, or an
+  # in-memory stand-in in tests).
+  def __init__(self, client, prefix="fyyur:"):
+    self.client = client
+    self.prefix = prefix
+
+  def get(self, key):
+    raw = self.client.get(self.prefix + key)
+    return None if raw is None else pickle.loads(raw)
+
+  def set(self, key, value, timeout=None):
+    self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=timeout or None)
+
+  def delete(self, key):
+    self.client.delete(self.prefix + key)
+
+  def incr(self, key):
+    # stored as a plain integer so INCR stays atomic on the server
+    return self.client.incr(self.prefix + key)
+
+  def version(self, key):
+    raw = self.client.get(self.prefix + key)
+    return int(raw) if raw is not None else 0
+
+#----------------------------------------------------------------------------#
+# Tag-versioned cache.
+#----------------------------------------------------------------------------#
+
+class Cache(object):
+  # Entries remember the version of every tag they were built from
+  # ("venue:3", "artist:7", "shows", ...). Write handlers bump tag
+  # versions with invalidate(); an entry whose snapshot no longer matches
+  # is rebuilt. Nothing has to be enumerated or deleted on write.
+  # Every invalidate() also bumps the generation ("tag:*"), so a value
+  # built while a write was being invalidated is recognised and not kept.
+  def __init__(self, app=None, backend=None):
+    self.backend = backend
+    self.timeout = 300
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault("CACHE_BACKEND", "lru")
+    app.config.setdefault("CACHE_DEFAULT_TIMEOUT", 300)
+    app.config.setdefault("CACHE_LRU_SIZE", 1024)
+    app.config.setdefault("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    self.timeout = app.config["CACHE_DEFAULT_TIMEOUT"]
+    if self.backend is not None:
+      return
+    kind = app.config["CACHE_BACKEND"]
+    if kind == "lru":
+      self.backend = LRUBackend(app.config["CACHE_LRU_SIZE"])
+    elif kind == "redis":
+      import redis
+      self.backend = RedisBackend(redis.Redis.from_url(app.config["CACHE_REDIS_URL"]))
+    elif kind == "null":
+      self.backend = NullBackend()
+    else:
+      raise ValueError(f"unknown CACHE_BACKEND {kind!r}")
+
+  def version(self, tag):
+    return self.backend.version("tag:" + tag)
+
+  def versions(self, tags):
+    return dict((tag, self.version(tag)) for tag in sorted(set(tags)))
+
+  def generation(self):
+    return self.version("*")
+
+  def invalidate(self, *tags):
+    # the generation first: a build that read it before this bump started
+    # after the write committed
+    self.backend.incr("tag:*")
+    for tag in tags:
+      self.backend.incr("tag:" + tag)
+    self.backend.set("invalidated_at", time.time())
+
+  def etag(self, key, versions):
+    raw = key + "|" + ",".join(f"{t}={v}" for t, v in sorted(versions.items()))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+  def lookup(self, key):
+    # -> (value, etag) of a current entry, or None
+    entry = self.backend.get("entry:" + key)
+    if entry is not None:
+      versions, value = entry
+      if self.versions(versions) == versions:
+        return value, self.etag(key, versions)
+    return None
+
+  def replica_behind(self, lag):
+    # True if a replica lagging up to `lag` seconds may miss the last write
+    invalidated = self.backend.get("invalidated_at")
+    return invalidated is not None and time.time() - invalidated < lag
+
+  def store(self, key, value, tags, timeout=None, since=None, lag=None):
+    # since: generation() read before value was built. Tag versions read
+    # after the build could already include a write the value missed; if
+    # the generation moved meanwhile the value is served but not kept, and
+    # its etag matches no stored entry. The same goes for a value read
+    # from a replica (lag: its lag window, by default the request's) while
+    # the last write may not have reached it.
+    versions = self.versions(tags)
+    if lag is None and has_request_context():
+      lag = g.get("db_replica_lag")
+    if since is not None and self.generation() != since or lag and self.replica_behind(lag):
+      versions["*"] = since if since is not None else self.generation()
+      return self.etag(key, versions)
+    self.backend.set("entry:" + key, (versions, value), timeout or self.timeout)
+    return self.etag(key, versions)
+
+  def fetch(self, key, build, timeout=None):
+    # build() -> (value, tags); returns (value, etag)
+    hit = self.lookup(key)
+    if hit is not None:
+      return hit
+    since = self.generation()
+    value, tags = build()
+    return value, self.store(key, value, tags, timeout, since)
+
+
+cache = Cache()
+
+
+def not_modified(etag):
+  # -> a 304 if the client already has this version, else None. Pending
+  # flash messages are part of the page, never answer 304 over them.
+  if etag in request.if_none_match and "_flashes" not in session:
+    return Response(status=304, headers={"ETag": f'"{etag}"'})
+  return None
+
+
+def render_cached(key, build, render):
+  value, etag = cache.fetch(key, build)
+  return cached_response(value, etag, render)
+
+
+def cached_response(value, etag, render):
+  unchanged = not_modified(etag)
+  if unchanged is not None:
+    return unchanged
+  response = make_response(render(value))
+  response.set_etag(etag)
+  response.cache_control.no_cache = True
+  return response
+
+
+def conditional(key, tags, respond):
+  # for responses that are not cached themselves (streamed pages)
+  etag = cache.etag(key, cache.versions(tags))
+  unchanged = not_modified(etag)
+  if unchanged is not None:
+    return unchanged
+  response = respond()
+  response.set_etag(etag)
+  response.cache_control.no_cache = True
+  return response
+
+#----------------------------------------------------------------------------#
+# Template fragments.
+#----------------------------------------------------------------------------#
+
+class FragmentCacheExtension(Extension):
+  # {% cache ("show", show.id, show.updated_at), 3600 %}...{% endcache %}
+  # Keys carry the updated_at of everything the fragment shows, so a
+  # changed row simply misses; nothing is invalidated. That makes a
+  # per-process LRU safe, and keeps tiles off the network even when the
+  # page cache is shared.
+  tags = {"cache"}
+
+  def __init__(self, environment):
+    super(FragmentCacheExtension, self).__init__(environment)
+    environment.extend(fragment_cache=None)
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    args = [parser.parse_expression()]
+    if parser.stream.skip_if("comma"):
+      args.append(parser.parse_expression())
+    else:
+      args.append(nodes.Const(None))
+    body = parser.parse_statements(["name:endcache"], drop_needle=True)
+    return nodes.CallBlock(self.call_method("_render", args), [], [], body).set_lineno(lineno)
+
+  def _render(self, key, timeout, caller):
+    backend = self.environment.fragment_cache
+    if backend is None:
+      return caller()
+    if isinstance(key, (tuple, list)):
+      key = "|".join(str(part) for part in key)
+    value = backend.get(key)
+    if value is None:
+      value = caller()
+      backend.set(key, value, timeout)
+    return Markup(value)
+
+
+def init_templates(app):
+  app.config.setdefault("FRAGMENT_CACHE_SIZE", 4096)
+  app.config.setdefault("JINJA_BYTECODE_CACHE", True)
+  app.config.setdefault("JINJA_BYTECODE_CACHE_DIR", None)
+  app.jinja_env.add_extension(FragmentCacheExtension)
+  if app.config["FRAGMENT_CACHE_SIZE"]:
+    app.jinja_env.fragment_cache = LRUBackend(app.config["FRAGMENT_CACHE_SIZE"])
+  if app.config["JINJA_BYTECODE_CACHE"]:
+    # compiled templates survive restarts; the source checksum is part of
+    # the entry, so edited templates are recompiled
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["JINJA_BYTECODE_CACHE_DIR"])
@@ -0,0 +1,196 @@
+import os
+import sys
+import click
+import dateutil.parser
+from app import app
+
+#----------------------------------------------------------------------------#
+# CLI commands (next to Flask-Migrate's `flask db ...`).
+#----------------------------------------------------------------------------#
+
+def _format(path, fmt):
+  if fmt:
+    return fmt
+  return "csv" if os.path.splitext(path)[1].lower() == ".csv" else "jsonl"
+
+
+@app.cli.command("import")
+@click.argument("kind", type=click.Choice(["venues", "artists", "shows"]))
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]),
+              help="Input format; guessed from the file extension by default.")
+@click.option("--chunk-size", default=1000, show_default=True,
+              help="Rows validated and inserted per transaction.")
+@click.option("--rejects", type=click.File("w", encoding="utf-8"),
+              help="Write rejected rows and their errors here as JSONL.")
+def import_command(kind, source, fmt, chunk_size, rejects):
+  """Bulk import venues, artists or shows from CSV or JSONL."""
+  from importer import IMPORTERS, read_rows
+
+  def progress(report):
+    click.echo(f"  {report.rows} rows read, {report.accepted} imported, "
+               f"{report.rejected} rejected ({report.rate:.0f} rows/s)", err=True)
+
+  rows = read_rows(source, _format(source.name, fmt))
+  report = IMPORTERS[kind](rows, chunk_size=chunk_size, rejects=rejects, progress=progress)
+  click.echo(f"Imported {report.accepted} {kind}, rejected {report.rejected} "
+             f"in {report.elapsed:.1f}s ({report.rate:.0f} rows/s)")
+
+
+@app.cli.command("export")
+@click.argument("kind", type=click.Choice(["venues", "artists", "shows"]))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl", "parquet"]), default="csv", show_default=True)
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Defaults to stdout (not for parquet).")
+@click.option("--since", help="Only rows updated at or after this timestamp.")
+@click.option("--after-id", type=int, help="Only rows with a greater id.")
+@click.option("--chunk-size", default=1000, show_default=True)
+def export_command(kind, fmt, output, since, after_id, chunk_size):
+  """Export venues, artists or shows in constant memory."""
+  from exporter import WRITERS, Watermark, iter_rows, write_parquet
+
+  rows = Watermark(iter_rows(
+    kind, since=dateutil.parser.parse(since) if since else None,
+    after_id=after_id, chunk_size=chunk_size
+  ))
+  if fmt == "parquet":
+    if not output:
+      raise click.UsageError("--output is required for parquet")
+    write_parquet(kind, rows, output, chunk_size=chunk_size)
+  else:
+    out = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+    try:
+      for part in WRITERS[fmt](kind, rows):
+        out.write(part)
+    finally:
+      if output:
+        out.close()
+  # watermarks for the next incremental run
+  click.echo(f"Exported {rows.count} {kind}; --after-id {rows.max_id} "
+             f"--since '{rows.max_updated_at.isoformat() if rows.max_updated_at else ''}'", err=True)
+
+
+@app.cli.group("counters")
+def counters_group():
+  """Maintain the denormalized show counters."""
+
+
+@counters_group.command("roll")
+def counters_roll():
+  """Move shows that have started since the last run from upcoming to past.
+
+  Run from cron, e.g. every 15 minutes."""
+  import counters
+  from cache import cache
+  moved = counters.roll_over()
+  cache.invalidate("venues", "artists")
+  if moved is None:
+    click.echo("Counters initialized")
+  else:
+    click.echo(f"Rolled {moved} shows over to past")
+
+
+@counters_group.command("rebuild")
+def counters_rebuild():
+  """Recount every venue and artist from the Show table."""
+  import counters
+  from cache import cache
+  counters.rebuild()
+  cache.invalidate("venues", "artists")
+  click.echo("Counters rebuilt")
+
+
+@app.cli.group("shows")
+def shows_group():
+  """Maintain the Show table."""
+
+
+@shows_group.command("partitions")
+@click.option("--ahead", default=3, show_default=True,
+              help="Create monthly partitions this many months past the current one.")
+@click.option("--detach-before", type=int,
+              help="Detach partitions that ended more than this many months ago.")
+def shows_partitions(ahead, detach_before):
+  """Create future monthly Show partitions and detach old ones.
+
+  Run from cron, e.g. daily. Detached partitions are kept as plain
+  tables; their shows no longer appear on any page or count."""
+  from datetime import datetime
+  import counters
+  import partitions
+  from cache import cache
+  if not partitions.is_partitioned():
+    raise click.UsageError('"Show" is not partitioned (Postgres only, see the b81f0c9d3e27 migration)')
+  today = datetime.today()
+  for table in partitions.ensure(today, ahead=ahead):
+    click.echo(f"Created {table}")
+  if detach_before is not None:
+    detached = partitions.detach_before(partitions.add_months(partitions.month_start(today), -detach_before))
+    for table in detached:
+      click.echo(f"Detached {table}")
+    if detached:
+      counters.rebuild()
+      cache.invalidate("shows", "venues", "artists")
+
+
+@app.cli.command("geocode")
+@click.option("--gazetteer", type=click.Path(exists=True, dir_okay=False),
+              help="CSV of name,state,latitude,longitude; defaults to GAZETTEER_PATH.")
+@click.option("--all", "overwrite", is_flag=True, help="Also re-locate cities and venues that have coordinates.")
+def geocode_command(gazetteer, overwrite):
+  """Locate cities from the local gazetteer and venues at their city.
+
+  Offline; run after imports, e.g. from cron."""
+  import geo
+  from cache import cache
+  cities, venues, unmatched = geo.geocode(gazetteer, overwrite=overwrite)
+  cache.invalidate("venues")
+  for name, state in unmatched:
+    click.echo(f"  not in the gazetteer: {name}, {state}", err=True)
+  click.echo(f"Located {cities} cities and {venues} venues; {len(unmatched)} cities not found")
+
+
+@app.cli.command("worker")
+@click.option("--processes", type=int, help="Worker processes; defaults to JOB_PROCESSES.")
+@click.option("--threads", type=int, help="Threads per process; defaults to JOB_THREADS.")
+@click.option("--poll", type=float, help="Seconds between polls when idle; defaults to JOB_POLL_SECONDS.")
+@click.option("--once", is_flag=True, help="Exit once no job is due instead of polling.")
+def worker_command(processes, threads, poll, once):
+  """Run background jobs from the Job table until interrupted."""
+  import jobs
+  jobs.run(processes=processes, threads=threads, poll=poll, once=once)
+
+
+@app.cli.group("jobs")
+def jobs_group():
+  """Inspect and clean up the background job queue."""
+
+
+@jobs_group.command("status")
+def jobs_status():
+  """Count jobs by status."""
+  import jobs
+  for status, count in sorted(jobs.stats().items()):
+    click.echo(f"{status:<8} {count}")
+
+
+@jobs_group.command("purge")
+@click.option("--days", default=7, show_default=True, help="Keep jobs finished more recently than this.")
+def jobs_purge(days):
+  """Delete finished jobs (and so their idempotency keys)."""
+  from datetime import datetime, timedelta
+  import jobs
+  deleted = jobs.purge(datetime.today() - timedelta(days=days))
+  click.echo(f"Purged {deleted} jobs")
+
+
+@app.cli.command("compile-templates")
+def compile_templates():
+  """Fill the Jinja bytecode cache, e.g. at deploy time, so new workers
+  start without compiling templates."""
+  env = app.jinja_env
+  if env.bytecode_cache is None:
+    raise click.UsageError("JINJA_BYTECODE_CACHE is off")
+  names = env.list_templates(extensions=["html"])
+  for name in names:
+    env.get_template(name)
+  click.echo(f"Compiled {len(names)} templates")
@@ -10,5 +10,93 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql:///fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///fyyur')
 SQLALCHEMY_TRACK_MODIFITIONS = False
+
+# Read replicas: comma separated URIs. Views marked read_only query one of
+# them; writes, and every other view, use the primary. Replication lag
+# means a page read right after a write may not show it yet.
+SQLALCHEMY_REPLICA_URIS = [u for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u]
+
+# Connection pool (Postgres only; SQLite keeps SQLAlchemy's defaults)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+# /_status/pools answers only requests carrying "Authorization: Bearer
+# <token>"; unset, the endpoint does not exist
+POOL_STATUS_TOKEN = os.environ.get('POOL_STATUS_TOKEN')
+
+if SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+  SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_pre_ping': DB_POOL_PRE_PING,
+    'connect_args': {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'},
+  }
+
+# Pagination
+ARTISTS_PER_PAGE = 50
+ARTISTS_MAX_PER_PAGE = 200
+SHOWS_PER_PAGE = 500
+
+# Show form artist/venue choices
+SHOW_FORM_CHOICES_TTL = 60
+SHOW_FORM_MAX_CHOICES = 1000
+
+# Show scheduling (minutes / days)
+SHOW_DEFAULT_DURATION = 120
+SHOW_MAX_DURATION = 24 * 60
+AVAILABILITY_MAX_DAYS = 92
+
+# Response cache: "lru" (per process), "redis" (shared) or "null"
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'lru')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_LRU_SIZE = 1024
+
+# Template tiles ({% cache %}, per process) and compiled template bytecode
+# (defaults to a directory under the system temp dir)
+FRAGMENT_CACHE_SIZE = 4096
+JINJA_BYTECODE_CACHE = True
+JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+
+# Search
+SEARCH_RESULTS_LIMIT = 50
+
+# Nearby venues and shows (see geo.py); `flask geocode` reads the gazetteer
+GAZETTEER_PATH = os.path.join(basedir, 'data', 'gazetteer.csv')
+NEARBY_RADIUS_KM = 25
+NEARBY_MAX_RADIUS_KM = 500
+NEARBY_LIMIT = 50
+NEARBY_MAX_LIMIT = 500
+
+# "Artists you might book" (see recommend.py; needs numpy and scipy)
+RECOMMEND_WEIGHTS = {'genre': 0.5, 'location': 0.3, 'history': 0.2}
+RECOMMEND_DISTANCE_KM = 100
+RECOMMEND_LIMIT = 20
+RECOMMEND_MAX_LIMIT = 100
+# seconds between incremental refreshes / full rebuilds of the model
+RECOMMEND_REFRESH_SECONDS = 5
+RECOMMEND_REBUILD_SECONDS = 3600
+
+# Background jobs (see jobs.py, `flask worker`). Each worker thread holds
+# one connection: keep JOB_THREADS within the pool size.
+JOB_PROCESSES = 1
+JOB_THREADS = 4
+JOB_POLL_SECONDS = 1.0
+JOB_MAX_ATTEMPTS = 5
+# seconds before the first retry, doubled on every further one
+JOB_RETRY_DELAY = 10
+# a running job not finished after this many seconds is taken over
+JOB_TIMEOUT = 300
+JOB_LINK_TIMEOUT = 5
+
+# Request profiling (Server-Timing headers + the app.perf log)
+PROFILE_REQUESTS = True
+PROFILE_SLOW_QUERY_MS = 100
+PROFILE_N_PLUS_ONE_THRESHOLD = 10
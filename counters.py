@@ -0,0 +1,94 @@
+from datetime import datetime
+from sqlalchemy import func, select
+from app import db, Venue, Artist, Show, Checkpoint
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue/Artist.past_shows_count and upcoming_shows_count split shows at the
+# "counters" checkpoint, not at the current time. Writes keep them exact
+# relative to that boundary; roll_over() advances it by moving the shows
+# that started since the last run from upcoming to past.
+
+CHECKPOINT = "counters"
+
+OWNERS = [(Venue, Show.venue_id), (Artist, Show.artist_id)]
+
+
+def boundary(lock=False):
+  # lock: True reads the checkpoint FOR UPDATE, "read" FOR SHARE
+  query = Checkpoint.query.filter(Checkpoint.name == CHECKPOINT)
+  if lock:
+    query = query.with_for_update(read=lock == "read")
+  checkpoint = query.first()
+  return checkpoint.value if checkpoint else None
+
+
+def show_created(venue_id, artist_id, start_time):
+  # two single-row increments in the caller's transaction; the checkpoint
+  # is held FOR SHARE so roll_over() cannot move it before this commits
+  split = boundary(lock="read")
+  if split is None:
+    return
+  column = "upcoming_shows_count" if start_time >= split else "past_shows_count"
+  for (model, _), id in zip(OWNERS, (venue_id, artist_id)):
+    table = model.__table__
+    db.session.execute(table.update().where(table.c.id == id)
+      .values({column: table.c[column] + 1}))
+
+
+def recount(venue_ids=None, artist_ids=None, split=None):
+  # recompute from Show; ids=None recounts every row of that table
+  split = split or boundary() or datetime.today()
+  for (model, owner_column), ids in zip(OWNERS, (venue_ids, artist_ids)):
+    if ids is not None and not ids:
+      continue
+    count = lambda condition: select([func.count(Show.id)]) \
+      .where(owner_column == model.id).where(condition).as_scalar()
+    stmt = model.__table__.update().values(
+      past_shows_count=count(Show.start_time < split),
+      upcoming_shows_count=count(Show.start_time >= split),
+    )
+    if ids is not None:
+      stmt = stmt.where(model.id.in_(ids))
+    db.session.execute(stmt)
+
+
+def roll_over(now=None):
+  # periodic job: shows that started in [checkpoint, now) stop counting as
+  # upcoming. The checkpoint row lock keeps concurrent runs from applying
+  # the same window twice.
+  now = now or datetime.today()
+  split = boundary(lock=True)
+  if split is None:
+    recount(split=now)
+    db.session.add(Checkpoint(name=CHECKPOINT, value=now))
+    db.session.commit()
+    return None
+  if now <= split:
+    db.session.rollback()
+    return 0
+  moved = 0
+  for model, owner_column in OWNERS:
+    rows = db.session.query(owner_column, func.count(Show.id)) \
+      .filter(Show.start_time >= split, Show.start_time < now) \
+      .group_by(owner_column).all()
+    table = model.__table__
+    for id, n in rows:
+      db.session.execute(table.update().where(table.c.id == id).values(
+        upcoming_shows_count=table.c.upcoming_shows_count - n,
+        past_shows_count=table.c.past_shows_count + n,
+      ))
+    moved = sum(n for _, n in rows)
+  Checkpoint.query.filter(Checkpoint.name == CHECKPOINT).update({"value": now})
+  db.session.commit()
+  return moved
+
+
+def rebuild(now=None):
+  now = now or datetime.today()
+  boundary(lock=True)
+  recount(split=now)
+  db.session.merge(Checkpoint(name=CHECKPOINT, value=now))
+  db.session.commit()
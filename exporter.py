@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+from datetime import datetime
+from app import db, City, Venue, Artist, Show, Genre, venue_genres, artist_genres
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+#----------------------------------------------------------------------------#
+
+CHUNK_SIZE = 1000
+
+COLUMNS = {
+  "venues": [
+    ("id", Venue.id), ("name", Venue.name), ("city", City.name),
+    ("state", Venue.state), ("address", Venue.address), ("phone", Venue.phone),
+    ("image_link", Venue.image_link), ("facebook_link", Venue.facebook_link),
+    ("website", Venue.website), ("seeking_talent", Venue.seeking_talent),
+    ("seeking_description", Venue.seeking_description), ("updated_at", Venue.updated_at),
+  ],
+  "artists": [
+    ("id", Artist.id), ("name", Artist.name), ("city", Artist.city),
+    ("state", Artist.state), ("phone", Artist.phone),
+    ("image_link", Artist.image_link), ("facebook_link", Artist.facebook_link),
+    ("website", Artist.website), ("seeking_venue", Artist.seeking_venue),
+    ("seeking_description", Artist.seeking_description), ("updated_at", Artist.updated_at),
+  ],
+  "shows": [
+    ("id", Show.id), ("venue_id", Show.venue_id), ("artist_id", Show.artist_id),
+    ("start_time", Show.start_time), ("end_time", Show.end_time), ("updated_at", Show.updated_at),
+  ],
+}
+
+MODELS = {"venues": Venue, "artists": Artist, "shows": Show}
+GENRES = {"venues": venue_genres.c.venue_id, "artists": artist_genres.c.artist_id}
+
+
+def fields(kind):
+  names = [name for name, _ in COLUMNS[kind]]
+  if kind in GENRES:
+    names.insert(2, "genres")
+  return names
+
+
+def _genres(owner_column, ids):
+  genres = dict((id, []) for id in ids)
+  rows = db.session.query(owner_column, Genre.name) \
+    .join(Genre, Genre.id == owner_column.table.c.genre_id) \
+    .filter(owner_column.in_(ids)) \
+    .order_by(owner_column, Genre.name)
+  for id, name in rows:
+    genres[id].append(name)
+  return genres
+
+
+def iter_rows(kind, since=None, after_id=None, chunk_size=CHUNK_SIZE):
+  # Rows in id order off a server-side cursor. `since` (updated_at) and
+  # `after_id` are the watermarks of a previous run for incremental exports.
+  model = MODELS[kind]
+  names = [name for name, _ in COLUMNS[kind]]
+  query = db.session.query(*[column for _, column in COLUMNS[kind]])
+  if kind == "venues":
+    query = query.join(City, City.id == Venue.city_id)
+  if since is not None:
+    query = query.filter(model.updated_at >= since)
+  if after_id is not None:
+    query = query.filter(model.id > after_id)
+  query = query.order_by(model.id).yield_per(chunk_size)
+
+  chunk = []
+  for row in query:
+    chunk.append(dict(zip(names, row)))
+    if len(chunk) == chunk_size:
+      for item in _with_genres(kind, chunk):
+        yield item
+      chunk = []
+  for item in _with_genres(kind, chunk):
+    yield item
+
+
+def _with_genres(kind, chunk):
+  if kind not in GENRES or not chunk:
+    return chunk
+  genres = _genres(GENRES[kind], [row["id"] for row in chunk])
+  for row in chunk:
+    row["genres"] = ",".join(genres[row["id"]])
+  return chunk
+
+
+def _json_default(value):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  raise TypeError(repr(value))
+
+
+def iter_csv(kind, rows):
+  buffer = io.StringIO()
+  writer = csv.DictWriter(buffer, fieldnames=fields(kind), extrasaction="ignore")
+  writer.writeheader()
+  for row in rows:
+    writer.writerow(row)
+    if buffer.tell() >= 64 * 1024:
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+  yield buffer.getvalue()
+
+
+def iter_jsonl(kind, rows):
+  lines = []
+  for row in rows:
+    lines.append(json.dumps(row, default=_json_default))
+    if len(lines) == CHUNK_SIZE:
+      yield "\n".join(lines) + "\n"
+      lines = []
+  if lines:
+    yield "\n".join(lines) + "\n"
+
+
+WRITERS = {"csv": iter_csv, "jsonl": iter_jsonl}
+
+
+def _schema(pyarrow, kind):
+  # declared from the column types: inferring from a batch fails on a
+  # column that is all None in it
+  types = {
+    db.Integer: pyarrow.int64(),
+    db.Boolean: pyarrow.bool_(),
+    db.DateTime: pyarrow.timestamp("us"),
+  }
+  columns = dict((name, column.type) for name, column in COLUMNS[kind])
+  return pyarrow.schema([
+    (name, next((t for base, t in types.items() if isinstance(columns.get(name), base)), pyarrow.string()))
+    for name in fields(kind)
+  ])
+
+
+def write_parquet(kind, rows, path, chunk_size=CHUNK_SIZE):
+  # optional: needs pyarrow
+  import pyarrow
+  import pyarrow.parquet
+  writer = None
+  schema = _schema(pyarrow, kind)
+  batch = []
+  try:
+    for row in rows:
+      batch.append(row)
+      if len(batch) == chunk_size:
+        writer = _write_batch(pyarrow, writer, path, schema, batch)
+        batch = []
+    if batch or writer is None:
+      writer = _write_batch(pyarrow, writer, path, schema, batch)
+  finally:
+    if writer is not None:
+      writer.close()
+
+
+def _write_batch(pyarrow, writer, path, schema, batch):
+  table = pyarrow.Table.from_pydict(
+    dict((n, [row.get(n) for row in batch]) for n in schema.names), schema=schema
+  )
+  if writer is None:
+    writer = pyarrow.parquet.ParquetWriter(path, schema)
+  writer.write_table(table)
+  return writer
+
+
+class Watermark(object):
+  # tracks the highest id / updated_at seen so the next run can resume
+  def __init__(self, rows):
+    self.rows = rows
+    self.max_id = None
+    self.max_updated_at = None
+    self.count = 0
+
+  def __iter__(self):
+    for row in self.rows:
+      self.count += 1
+      self.max_id = row["id"] if self.max_id is None else max(self.max_id, row["id"])
+      if row["updated_at"] is not None and (self.max_updated_at is None or row["updated_at"] > self.max_updated_at):
+        self.max_updated_at = row["updated_at"]
+      yield row
@@ -1,14 +1,28 @@
+import os
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
 # prepare for deployment
 
 
+BENCH_BASELINE = "benchmarks/baseline.json"
+
+
+def bench(save=False):
+    # fab bench:save=1 records the baseline the later runs compare against
+    if save or not os.path.exists(BENCH_BASELINE):
+        local("python -m benchmarks.controllers --save {}".format(BENCH_BASELINE))
+    else:
+        local("python -m benchmarks.controllers --compare {}".format(BENCH_BASELINE))
+
+
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local("python -m compileall -q .", capture=True)
+        if not result.failed and os.path.exists(BENCH_BASELINE):
+            result = local(
+                "python -m benchmarks.controllers --compare {}".format(BENCH_BASELINE)
+            )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
@@ -40,7 +54,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python -m compileall -q ."
     )
 
 
@@ -0,0 +1,57 @@
+from datetime import date
+from functools import lru_cache
+import dateutil.parser
+import pytz
+from babel import Locale
+from babel.dates import LC_TIME, parse_pattern
+from helper import STATE_TIMEZONES
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+FORMATS = {
+  "full": "EEEE MMMM, d, y 'at' h:mma",
+  "medium": "EE MM, dd, y h:mma",
+  # the show tiles; the same text strftime('%A %B, %d, %I at %p') gave
+  "tile": "EEEE MMMM, dd, hh 'at' a",
+  "tile_tz": "EEEE MMMM, dd, hh 'at' a z",
+  "time": "h:mma",
+  "month": "MMMM y",
+}
+
+
+@lru_cache(maxsize=256)
+def _compiled(format, locale):
+  # (DateTimePattern, Locale) per (format, locale): babel.dates.format_datetime
+  # parses the locale and re-resolves the pattern on every call
+  return parse_pattern(FORMATS.get(format, format)), Locale.parse(locale or LC_TIME)
+
+
+@lru_cache(maxsize=None)
+def _zone(name):
+  return pytz.timezone(name)
+
+
+def state_timezone(state):
+  return STATE_TIMEZONES.get(state)
+
+
+def format_datetime(value, format="medium", tz=None, locale=None):
+  # Accepts datetimes (strings are still parsed, for old callers). Show
+  # times are stored naive, as the wall-clock time at the venue: with tz a
+  # naive value is labelled with that zone, an aware one is converted.
+  if value is None or value == "":
+    return ""
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  if tz is not None and type(value) is not date:
+    zone = _zone(tz) if isinstance(tz, str) else tz
+    if value.tzinfo is not None:
+      value = value.astimezone(zone)
+    elif hasattr(zone, "localize"):
+      value = zone.localize(value)
+    else:
+      value = value.replace(tzinfo=zone)
+  pattern, locale = _compiled(format, locale)
+  return pattern.apply(value, locale)
@@ -1,22 +1,72 @@
+import threading
+import time
 from datetime import datetime
+from flask import current_app
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, IntegerField
 from wtforms.fields.html5 import DateTimeLocalField, TelField
-from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, NumberRange
 from helper import GENRES, STATES
-from app import Artist, Venue
+from app import db, Artist, Venue
 import phonenumbers
 
+class ChoiceCache(object):
+    # (id, name) pairs for a select field, reloaded when the TTL expires or
+    # invalidate() is called by a write handler in this process.
+    def __init__(self, model):
+        self.model = model
+        self.version = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def get(self):
+        entry = self._entry
+        if entry is not None and entry[0] == self.version and entry[1] > time.monotonic():
+            return entry[2]
+        with self._lock:
+            version = self.version
+            rows = db.session.query(self.model.id, self.model.name) \
+                .order_by(self.model.name) \
+                .limit(current_app.config["SHOW_FORM_MAX_CHOICES"] + 1) \
+                .all()
+            choices = [(id, name) for id, name in rows]
+            expires = time.monotonic() + current_app.config["SHOW_FORM_CHOICES_TTL"]
+            self._entry = (version, expires, choices)
+            return choices
+
+    def choices(self):
+        # past the limit the field starts empty and is filled by typeahead
+        choices = self.get()
+        if len(choices) > current_app.config["SHOW_FORM_MAX_CHOICES"]:
+            return []
+        return choices
+
+artist_choices = ChoiceCache(Artist)
+venue_choices = ChoiceCache(Venue)
+
 class ShowForm(Form):
     artist_id = SelectField(
-        'artist_id', validators=[DataRequired()],
-        choices= [(art.id, art.name) for art in Artist.query.all()]
+        'artist_id', validators=[DataRequired()], coerce=int,
+        choices=[]
     )
     venue_id =SelectField(
-        'venue_id', validators=[DataRequired()],
-        choices= [(ven.id, ven.name) for ven in Venue.query.all()]
+        'venue_id', validators=[DataRequired()], coerce=int,
+        choices=[]
+    )
+    start_time = DateTimeLocalField('start_time', validators=[DataRequired()], default=datetime.today)
+    duration = IntegerField(
+        'duration', validators=[NumberRange(min=1)],
+        default=lambda: current_app.config["SHOW_DEFAULT_DURATION"]
     )
-    start_time = DateTimeLocalField('start_time', validators=[DataRequired()], default= datetime.today())
+
+    def __init__(self, *args, **kwargs):
+        super(ShowForm, self).__init__(*args, **kwargs)
+        self.artist_id.choices = artist_choices.choices()
+        self.venue_id.choices = venue_choices.choices()
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,261 @@
+import csv
+import math
+from collections import namedtuple
+from sqlalchemy import and_, or_
+from app import app, db, City, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
+
+# Venues carry latitude/longitude plus a geohash of them. Geohashes that
+# share a prefix lie in the same cell, and every cell is one contiguous
+# range of the B-tree index on Venue.geohash, so "near (lat, lng)" is a
+# handful of index range scans (the cells covering the search circle's
+# bounding box) followed by an exact distance check. Works the same on
+# Postgres and SQLite, without PostGIS.
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+# ranges scanned per query, at most
+MAX_CELLS = 16
+
+
+def encode(lat, lng, precision=PRECISION):
+  lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+  chars = []
+  bits = 0
+  value = 0
+  even = True
+  while len(chars) < precision:
+    span, coordinate = (lng_range, lng) if even else (lat_range, lat)
+    mid = (span[0] + span[1]) / 2
+    value <<= 1
+    if coordinate >= mid:
+      value |= 1
+      span[0] = mid
+    else:
+      span[1] = mid
+    even = not even
+    bits += 1
+    if bits == 5:
+      chars.append(BASE32[value])
+      bits = value = 0
+  return "".join(chars)
+
+
+def cell_size(precision):
+  # -> (degrees of latitude, degrees of longitude) of one cell
+  bits = 5 * precision
+  return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+  # haversine
+  lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+  a = math.sin((lat2 - lat1) / 2) ** 2 + \
+    math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_boxes(lat, lng, radius_km):
+  # -> [(min_lat, max_lat, min_lng, max_lng)], split in two where the
+  # circle crosses the antimeridian
+  angle = radius_km / EARTH_RADIUS_KM
+  dlat = math.degrees(angle)
+  min_lat, max_lat = lat - dlat, lat + dlat
+  if min_lat <= -90 or max_lat >= 90 or math.sin(angle) >= math.cos(math.radians(lat)):
+    return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+  dlng = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+  min_lng, max_lng = lng - dlng, lng + dlng
+  if min_lng < -180:
+    return [(min_lat, max_lat, min_lng + 360, 180.0), (min_lat, max_lat, -180.0, max_lng)]
+  if max_lng > 180:
+    return [(min_lat, max_lat, min_lng, 180.0), (min_lat, max_lat, -180.0, max_lng - 360)]
+  return [(min_lat, max_lat, min_lng, max_lng)]
+
+
+def _cells(box, precision):
+  # -> (lat indexes, lng indexes) of the cells a box touches
+  cell_lat, cell_lng = cell_size(precision)
+  index = lambda value, origin, cell, count: min(int((value - origin) // cell), count - 1)
+  lat_count, lng_count = round(180 / cell_lat), round(360 / cell_lng)
+  min_lat, max_lat, min_lng, max_lng = box
+  return (
+    range(index(min_lat, -90, cell_lat, lat_count), index(max_lat, -90, cell_lat, lat_count) + 1),
+    range(index(min_lng, -180, cell_lng, lng_count), index(max_lng, -180, cell_lng, lng_count) + 1),
+  )
+
+
+def cover(boxes, max_cells=MAX_CELLS):
+  # -> sorted geohash prefixes of the finest cells covering the boxes,
+  # with no more than max_cells of them
+  precision = PRECISION
+  while precision > 1:
+    cells = [_cells(box, precision) for box in boxes]
+    if sum(len(lats) * len(lngs) for lats, lngs in cells) <= max_cells:
+      break
+    precision -= 1
+  cell_lat, cell_lng = cell_size(precision)
+  prefixes = set()
+  for lats, lngs in (_cells(box, precision) for box in boxes):
+    for i in lats:
+      for j in lngs:
+        prefixes.add(encode(-90 + (i + 0.5) * cell_lat, -180 + (j + 0.5) * cell_lng, precision))
+  return sorted(prefixes)
+
+
+def _successor(prefix):
+  # the smallest string after every string starting with prefix
+  while prefix and prefix[-1] == BASE32[-1]:
+    prefix = prefix[:-1]
+  if not prefix:
+    return None
+  return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+
+def ranges(prefixes):
+  # -> [(low, high)] half-open index ranges; neighbouring cells in
+  # geohash order are merged into one range (high None: unbounded)
+  merged = []
+  for prefix in prefixes:
+    low, high = prefix, _successor(prefix)
+    if merged and merged[-1][1] == low:
+      merged[-1] = (merged[-1][0], high)
+    else:
+      merged.append((low, high))
+  return merged
+
+
+def within(column, lat, lng, radius_km):
+  # SQL filter: column (a geohash) inside the cells covering the circle
+  conditions = []
+  for low, high in ranges(cover(bounding_boxes(lat, lng, radius_km))):
+    conditions.append(column >= low if high is None else and_(column >= low, column < high))
+  return or_(*conditions)
+
+
+def nearby_venues(lat, lng, radius_km, limit=None):
+  # -> [(distance_km, row)] by distance; rows are
+  # (id, name, city, state, latitude, longitude)
+  rows = db.session.query(
+    Venue.id, Venue.name, City.name.label("city"), Venue.state, Venue.latitude, Venue.longitude,
+  ).join(City, City.id == Venue.city_id) \
+   .filter(within(Venue.geohash, lat, lng, radius_km))
+  found = []
+  for row in rows:
+    distance = distance_km(lat, lng, row.latitude, row.longitude)
+    if distance <= radius_km:
+      found.append((distance, row))
+  found.sort(key=lambda item: (item[0], item[1].id))
+  return found[:limit] if limit else found
+
+
+VenueRow = namedtuple("VenueRow", "id name city state latitude longitude")
+ShowRow = namedtuple("ShowRow", "id venue_id artist_id artist_name start_time end_time")
+
+
+def nearby_shows(lat, lng, radius_km, start, end, limit=None):
+  # -> [(distance_km, venue row, show row)] by start_time; rows are
+  # VenueRow and ShowRow. The cells are matched in the show query itself,
+  # so only shows (and their venues) are read, a batch at a time, never
+  # every venue in the radius; the cells overshoot the circle, so a batch
+  # can come back short and the next one is read.
+  query = db.session.query(
+    Show.id, Show.venue_id, Show.artist_id, Artist.name, Show.start_time, Show.end_time,
+    Venue.name, City.name, Venue.state, Venue.latitude, Venue.longitude,
+  ).join(Venue, Venue.id == Show.venue_id) \
+   .join(City, City.id == Venue.city_id) \
+   .join(Artist, Artist.id == Show.artist_id) \
+   .filter(within(Venue.geohash, lat, lng, radius_km)) \
+   .filter(Show.start_time >= start, Show.start_time < end) \
+   .order_by(Show.start_time, Show.id)
+  batch = max(limit or 0, 100)
+  found, distances, last = [], {}, None
+  while limit is None or len(found) < limit:
+    page = query
+    if last is not None:
+      page = page.filter(or_(Show.start_time > last[0], and_(Show.start_time == last[0], Show.id > last[1])))
+    rows = page.limit(batch).all()
+    for row in rows:
+      show, venue = ShowRow(*row[:6]), VenueRow(row[1], *row[6:])
+      if venue.id not in distances:
+        distances[venue.id] = distance_km(lat, lng, venue.latitude, venue.longitude)
+      if distances[venue.id] <= radius_km:
+        found.append((distances[venue.id], venue, show))
+    if len(rows) < batch:
+      break
+    last = (rows[-1][4], rows[-1][0])
+  return found[:limit] if limit else found
+
+
+def place(venue):
+  # a venue is placed at its city until something more precise exists
+  row = db.session.query(City.latitude, City.longitude).filter(City.id == venue.city_id).first()
+  if row is None or row.latitude is None:
+    venue.latitude = venue.longitude = venue.geohash = None
+  else:
+    venue.latitude, venue.longitude = row.latitude, row.longitude
+    venue.geohash = encode(row.latitude, row.longitude)
+
+#----------------------------------------------------------------------------#
+# Offline geocoding from the bundled gazetteer.
+#----------------------------------------------------------------------------#
+
+def read_gazetteer(path=None):
+  # -> {City.key(name, state): (latitude, longitude)}
+  with open(path or app.config["GAZETTEER_PATH"], encoding="utf-8", newline="") as f:
+    return dict(
+      (City.key(row["name"], row["state"]), (float(row["latitude"]), float(row["longitude"])))
+      for row in csv.DictReader(f)
+    )
+
+
+def locate_city(city_id, path=None):
+  # -> venues placed, or None if the city is not in the gazetteer; the
+  # caller commits
+  city = City.query.get(city_id)
+  point = city and read_gazetteer(path).get(City.key(city.name, city.state))
+  if point is None:
+    return None
+  city.latitude, city.longitude = point
+  return db.session.query(Venue).filter(Venue.city_id == city_id, Venue.latitude.is_(None)).update({
+    "latitude": point[0], "longitude": point[1], "geohash": encode(*point),
+  }, synchronize_session=False)
+
+
+def _update(model, mappings, chunk_size):
+  for i in range(0, len(mappings), chunk_size):
+    db.session.bulk_update_mappings(model, mappings[i:i + chunk_size])
+    db.session.commit()
+
+
+def geocode(path=None, overwrite=False, chunk_size=1000):
+  # -> (cities located, venues located, [(name, state)] not in the gazetteer)
+  gazetteer = read_gazetteer(path)
+  query = db.session.query(City.id, City.name, City.state)
+  if not overwrite:
+    query = query.filter(City.latitude.is_(None))
+  cities, unmatched = [], []
+  for id, name, state in query:
+    point = gazetteer.get(City.key(name, state))
+    if point is None:
+      unmatched.append((name, state))
+    else:
+      cities.append({"id": id, "latitude": point[0], "longitude": point[1]})
+  _update(City, cities, chunk_size)
+
+  located = dict((id, (lat, lng)) for id, lat, lng in
+    db.session.query(City.id, City.latitude, City.longitude).filter(City.latitude.isnot(None)))
+  query = db.session.query(Venue.id, Venue.city_id)
+  if not overwrite:
+    query = query.filter(Venue.latitude.is_(None))
+  venues = [{
+    "id": id,
+    "latitude": located[city_id][0],
+    "longitude": located[city_id][1],
+    "geohash": encode(*located[city_id]),
+  } for id, city_id in query if city_id in located]
+  _update(Venue, venues, chunk_size)
+  return len(cities), len(venues), unmatched
@@ -0,0 +1,327 @@
+import csv
+import io
+import json
+import time
+from bisect import bisect_left
+from itertools import islice
+import dateutil.parser
+from werkzeug.datastructures import MultiDict
+from app import db, City, Venue, Artist, Genre, Show, venue_genres, artist_genres
+from cache import cache
+import counters
+import scheduling
+from forms import VenueForm, ArtistForm, venue_choices, artist_choices
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+def read_rows(stream, fmt):
+  # -> (file line, row, error) one at a time; nothing holds more than the
+  # current chunk. A line that is not a row is passed on with an error
+  # for the report instead of ending the import.
+  if fmt == "csv":
+    reader = csv.DictReader(stream)
+    for row in reader:
+      # the record's last line; quoted fields can span lines
+      yield reader.line_num, row, None
+  else:
+    for number, line in enumerate(stream, 1):
+      if not line.strip():
+        continue
+      try:
+        row = json.loads(line)
+      except ValueError as error:
+        yield number, line.rstrip("\r\n"), f"Not valid JSON: {error}"
+        continue
+      if isinstance(row, dict):
+        yield number, row, None
+      else:
+        yield number, row, "Not a JSON object"
+
+
+def chunked(rows, size):
+  rows = iter(rows)
+  while True:
+    chunk = list(islice(rows, size))
+    if not chunk:
+      return
+    yield chunk
+
+
+class ImportReport(object):
+  def __init__(self, rejects=None):
+    self.accepted = 0
+    self.rejected = 0
+    # rows read, and the file line of the last one
+    self.rows = 0
+    self.line = 0
+    self.rejects = rejects
+    self.started = time.perf_counter()
+
+  def reject(self, line, row, errors):
+    self.rejected += 1
+    if self.rejects is not None:
+      self.rejects.write(json.dumps({"line": line, "row": row, "errors": errors}, default=str) + "\n")
+
+  def read(self, chunk):
+    # -> [(line, row)] of the chunk's readable rows; the rest are rejected
+    rows = []
+    for line, row, error in chunk:
+      self.rows += 1
+      self.line = line
+      if error:
+        self.reject(line, row, {"row": [error]})
+      else:
+        rows.append((line, row))
+    return rows
+
+  @property
+  def elapsed(self):
+    return time.perf_counter() - self.started
+
+  @property
+  def rate(self):
+    return self.accepted / self.elapsed if self.elapsed else 0.0
+
+
+def _genres(value):
+  if isinstance(value, list):
+    return value
+  return [g.strip() for g in (value or "").split(",") if g.strip()]
+
+
+def _validate(form_class, row):
+  # the same field rules as the web forms, phonenumbers check included
+  data = MultiDict(dict((k, str(v)) for k, v in row.items() if k != "genres" and v is not None))
+  for genre in _genres(row.get("genres")):
+    data.add("genres", genre)
+  for flag in ("seeking_talent", "seeking_venue"):
+    if str(data.get(flag, "")).lower() in ("false", "0", "no", ""):
+      data.pop(flag, None)
+  form = form_class(formdata=data, meta={"csrf": False})
+  if not form.validate():
+    return None, form.errors
+  return form, None
+
+
+def _insert_owners(model, association, owner_id, forms, extra):
+  # bulk insert the owners, then their genre rows; return_defaults reads
+  # back the generated ids the association rows need
+  genres = Genre.resolve(set(name for form in forms for name in form.genres.data))
+  db.session.flush()
+  genres = dict((g.name, g.id) for g in genres)
+  mappings = []
+  for form in forms:
+    mapping = {
+      "name": form.name.data,
+      "state": form.state.data,
+      "phone": form.phone.data,
+      "image_link": form.image_link.data,
+      "facebook_link": form.facebook_link.data,
+      "website": form.website.data,
+      "seeking_description": form.seeking_description.data,
+    }
+    mapping.update(extra(form))
+    mappings.append(mapping)
+  db.session.bulk_insert_mappings(model, mappings, return_defaults=True)
+  rows = [{owner_id: mapping["id"], "genre_id": genres[name]}
+          for mapping, form in zip(mappings, forms)
+          for name in dict.fromkeys(form.genres.data)]
+  if rows:
+    db.session.execute(association.insert(), rows)
+  return mappings
+
+
+def import_venues(rows, chunk_size=1000, rejects=None, progress=None):
+  report = ImportReport(rejects)
+  for chunk in chunked(rows, chunk_size):
+    valid = []
+    for line, row in report.read(chunk):
+      form, errors = _validate(VenueForm, row)
+      if errors:
+        report.reject(line, row, errors)
+      else:
+        valid.append(form)
+    if valid:
+      cities = City.resolve_many((f.city.data, f.state.data) for f in valid)
+      _insert_owners(Venue, venue_genres, "venue_id", valid, lambda f: {
+        "address": f.address.data,
+        "seeking_talent": bool(f.seeking_talent.data),
+        "city_id": cities[(f.city.data, f.state.data)][0],
+      })
+      db.session.commit()
+      report.accepted += len(valid)
+    if progress:
+      progress(report)
+  venue_choices.invalidate()
+  cache.invalidate("venues")
+  return report
+
+
+def import_artists(rows, chunk_size=1000, rejects=None, progress=None):
+  report = ImportReport(rejects)
+  for chunk in chunked(rows, chunk_size):
+    valid = []
+    for line, row in report.read(chunk):
+      form, errors = _validate(ArtistForm, row)
+      if errors:
+        report.reject(line, row, errors)
+      else:
+        valid.append(form)
+    if valid:
+      cities = City.resolve_many((f.city.data, f.state.data) for f in valid)
+      _insert_owners(Artist, artist_genres, "artist_id", valid, lambda f: {
+        "seeking_venue": bool(f.seeking_venue.data),
+        "city": cities[(f.city.data, f.state.data)][1],
+      })
+      db.session.commit()
+      report.accepted += len(valid)
+    if progress:
+      progress(report)
+  artist_choices.invalidate()
+  cache.invalidate("artists")
+  return report
+
+
+def _validate_show(row, venue_ids, artist_ids):
+  errors = {}
+  try:
+    venue_id = int(row.get("venue_id"))
+    if venue_id not in venue_ids:
+      errors["venue_id"] = ["Unknown venue"]
+  except (TypeError, ValueError):
+    errors["venue_id"] = ["Not a valid integer"]
+  try:
+    artist_id = int(row.get("artist_id"))
+    if artist_id not in artist_ids:
+      errors["artist_id"] = ["Unknown artist"]
+  except (TypeError, ValueError):
+    errors["artist_id"] = ["Not a valid integer"]
+  try:
+    start_time = dateutil.parser.parse(row.get("start_time") or "")
+  except (ValueError, OverflowError):
+    errors["start_time"] = ["Not a valid datetime"]
+  else:
+    try:
+      if row.get("end_time"):
+        end_time = dateutil.parser.parse(row["end_time"])
+        scheduling.check_duration(start_time, end_time)
+      else:
+        end_time = scheduling.end_time(start_time, int(row.get("duration") or 0))
+    except (ValueError, OverflowError, TypeError) as e:
+      errors["end_time"] = [str(e) or "Not a valid datetime"]
+  if errors:
+    return None, errors
+  return {"venue_id": venue_id, "artist_id": artist_id, "start_time": start_time, "end_time": end_time}, None
+
+
+class Bookings(object):
+  # The chunk's clash check: the shows already booked for its venues and
+  # artists (one query, see scheduling.booked) plus the rows accepted
+  # earlier in the chunk, which never overlap each other.
+  def __init__(self, mappings):
+    self.existing = {}
+    self.accepted = {}
+    if mappings:
+      self.existing = scheduling.booked(
+        (m["venue_id"] for m in mappings), (m["artist_id"] for m in mappings),
+        min(scheduling.naive(m["start_time"]) for m in mappings),
+        max(scheduling.naive(m["end_time"]) for m in mappings)
+      )
+
+  def clashes(self, mapping):
+    start, end = scheduling.naive(mapping["start_time"]), scheduling.naive(mapping["end_time"])
+    found = []
+    for kind in ("venue", "artist"):
+      key = (kind, mapping[kind + "_id"])
+      tree = self.existing.get(key)
+      if tree is not None and tree.overlapping(start, end):
+        found.append(kind)
+        continue
+      starts, ends = self.accepted.get(key, ([], []))
+      i = bisect_left(starts, end) - 1
+      if i >= 0 and ends[i] > start:
+        found.append(kind)
+    return found
+
+  def add(self, mapping):
+    start, end = scheduling.naive(mapping["start_time"]), scheduling.naive(mapping["end_time"])
+    for kind in ("venue", "artist"):
+      starts, ends = self.accepted.setdefault((kind, mapping[kind + "_id"]), ([], []))
+      i = bisect_left(starts, start)
+      starts.insert(i, start)
+      ends.insert(i, end)
+
+
+def _ids(model, values):
+  ids = set()
+  for value in values:
+    try:
+      ids.add(int(value))
+    except (TypeError, ValueError):
+      pass
+  if not ids:
+    return set()
+  return set(id for id, in db.session.query(model.id).filter(model.id.in_(ids)))
+
+
+def _copy_shows(mappings):
+  # Postgres COPY: one round-trip per chunk instead of an INSERT per row
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for m in mappings:
+    writer.writerow([m["artist_id"], m["venue_id"], m["start_time"].isoformat(), m["end_time"].isoformat()])
+  buffer.seek(0)
+  cursor = db.session.connection().connection.cursor()
+  cursor.copy_expert('COPY "Show" (artist_id, venue_id, start_time, end_time) FROM STDIN WITH CSV', buffer)
+
+
+def import_shows(rows, chunk_size=1000, rejects=None, progress=None, copy=None):
+  report = ImportReport(rejects)
+  if copy is None:
+    copy = db.engine.dialect.name == "postgresql"
+  for chunk in chunked(rows, chunk_size):
+    chunk = report.read(chunk)
+    venue_ids = _ids(Venue, (row.get("venue_id") for _, row in chunk))
+    artist_ids = _ids(Artist, (row.get("artist_id") for _, row in chunk))
+    scheduling.lock(venue_ids, artist_ids)
+    checked = []
+    for line, row in chunk:
+      mapping, errors = _validate_show(row, venue_ids, artist_ids)
+      checked.append((line, row, mapping, errors))
+    bookings = Bookings([mapping for _, _, mapping, errors in checked if not errors])
+    valid = []
+    for line, row, mapping, errors in checked:
+      if not errors:
+        clashes = bookings.clashes(mapping)
+        if clashes:
+          errors = dict((kind + "_id", ["Already booked at that time"]) for kind in clashes)
+      if errors:
+        report.reject(line, row, errors)
+      else:
+        valid.append(mapping)
+        bookings.add(mapping)
+    if valid:
+      if copy:
+        _copy_shows(valid)
+      else:
+        db.session.bulk_insert_mappings(Show, valid)
+      counters.recount(
+        venue_ids=set(m["venue_id"] for m in valid),
+        artist_ids=set(m["artist_id"] for m in valid)
+      )
+      db.session.commit()
+      # also drops the interval trees scheduling caches for web bookings
+      cache.invalidate("shows", "venues", "artists")
+      report.accepted += len(valid)
+    if progress:
+      progress(report)
+  return report
+
+
+IMPORTERS = {
+  "venues": import_venues,
+  "artists": import_artists,
+  "shows": import_shows,
+}
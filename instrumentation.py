@@ -0,0 +1,176 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Query counting.
+#----------------------------------------------------------------------------#
+
+_local = threading.local()
+
+
+class QueryCounter(object):
+  def __init__(self, slow_threshold=None):
+    self.count = 0
+    self.statements = []
+    self.db_time = 0.0
+    self.slow_threshold = slow_threshold
+    self.slow = []
+
+  def record(self, statement, duration=0.0):
+    self.count += 1
+    self.statements.append(statement)
+    self.db_time += duration
+
+  def shapes(self):
+    return Counter(statement_shape(s) for s in self.statements)
+
+  def repeated(self, threshold):
+    # the same statement shape issued more than `threshold` times is
+    # almost always a lazy load inside a loop
+    return dict((shape, n) for shape, n in self.shapes().items() if n > threshold)
+
+
+_PARAM = re.compile(r"%\(\w+\)s|\?|:\w+|\$\d+")
+_PARAM_LIST = re.compile(r"\(\s*\?(\s*,\s*\?)*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+  shape = _PARAM.sub("?", statement)
+  shape = _NUMBER.sub("?", shape)
+  shape = _PARAM_LIST.sub("(?)", shape)
+  return _SPACE.sub(" ", shape).strip()
+
+
+def _active_counters():
+  counters = getattr(_local, "counters", None)
+  if counters is None:
+    counters = _local.counters = []
+  return counters
+
+
+# The start time lives on the execution context, which is dropped with the
+# statement; a statement that fails never reaches after_cursor_execute.
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if context is not None:
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  # statements run without a context (dialect set-up) are counted, untimed
+  start = getattr(context, "_query_start", None)
+  duration = time.perf_counter() - start if start is not None else 0.0
+  for counter in _active_counters():
+    counter.record(statement, duration)
+    if counter.slow_threshold is not None and duration >= counter.slow_threshold:
+      counter.slow.append((statement, duration))
+
+
+@contextmanager
+def count_queries(slow_threshold=None):
+  # with count_queries() as counter:
+  #   venue_detail(1)
+  # assert counter.count <= 2
+  counter = QueryCounter(slow_threshold)
+  start_counting(counter)
+  try:
+    yield counter
+  finally:
+    stop_counting(counter)
+
+
+def start_counting(counter):
+  _active_counters().append(counter)
+
+
+def stop_counting(counter):
+  counters = _active_counters()
+  if counter in counters:
+    counters.remove(counter)
+
+#----------------------------------------------------------------------------#
+# Request profiling.
+#----------------------------------------------------------------------------#
+
+def _ms(seconds):
+  return round(seconds * 1000, 3)
+
+
+def _render_started(sender, template, context, **extra):
+  g.render_start = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+  if "render_start" in g:
+    g.render_time += time.perf_counter() - g.pop("render_start")
+
+
+def init_app(app):
+  app.config.setdefault("PROFILE_REQUESTS", True)
+  app.config.setdefault("PROFILE_SLOW_QUERY_MS", 100)
+  app.config.setdefault("PROFILE_N_PLUS_ONE_THRESHOLD", 10)
+  if not app.config["PROFILE_REQUESTS"]:
+    return
+  logger = app.logger.getChild("perf")
+
+  @app.before_request
+  def _start_profile():
+    g.profile_start = time.perf_counter()
+    g.render_time = 0.0
+    g.query_counter = QueryCounter(app.config["PROFILE_SLOW_QUERY_MS"] / 1000.0)
+    start_counting(g.query_counter)
+
+  # blinker holds receivers weakly: they must outlive this function
+  before_render_template.connect(_render_started, app)
+  template_rendered.connect(_render_finished, app)
+
+  @app.after_request
+  def _finish_profile(response):
+    counter = g.get("query_counter")
+    if counter is None:
+      return response
+    total = time.perf_counter() - g.profile_start
+    # streamed bodies render after this point and are not included
+    response.headers.add("Server-Timing", 'db;dur=%s;desc="%d queries"' % (_ms(counter.db_time), counter.count))
+    response.headers.add("Server-Timing", "render;dur=%s" % _ms(g.render_time))
+    response.headers.add("Server-Timing", "total;dur=%s" % _ms(total))
+
+    repeated = counter.repeated(app.config["PROFILE_N_PLUS_ONE_THRESHOLD"])
+    record = {
+      "method": request.method,
+      "path": request.path,
+      "endpoint": request.endpoint,
+      "status": response.status_code,
+      "queries": counter.count,
+      "db_ms": _ms(counter.db_time),
+      "render_ms": _ms(g.render_time),
+      "total_ms": _ms(total),
+    }
+    if repeated:
+      record["n_plus_one"] = repeated
+    if counter.slow:
+      record["slow_queries"] = [
+        {"statement": statement_shape(s), "ms": _ms(d)} for s, d in counter.slow
+      ]
+    if repeated or counter.slow:
+      logger.warning(json.dumps(record))
+    else:
+      logger.info(json.dumps(record))
+    return response
+
+  @app.teardown_request
+  def _stop_profile(exc):
+    counter = g.pop("query_counter", None)
+    if counter is not None:
+      stop_counting(counter)
@@ -0,0 +1,301 @@
+import ipaddress
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import traceback
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import app, db, Job, Venue, Artist
+from cache import cache
+import counters
+
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Jobs are rows of the "Job" table, queued with enqueue() inside the
+# caller's transaction: a job exists exactly when the write that asked for
+# it committed. Workers (`flask worker`) claim due jobs with SELECT ...
+# FOR UPDATE SKIP LOCKED, so any number of them share the table without
+# taking the same job; there is no broker to run. A failed job is retried
+# with exponential backoff up to max_attempts, and a job whose worker died
+# is taken over once JOB_TIMEOUT has passed, so handlers must be safe to
+# run more than once.
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+HANDLERS = {}
+
+
+class PermanentError(Exception):
+  # raised by a handler for failures retrying cannot fix
+  pass
+
+
+def handler(kind):
+  def register(fn):
+    HANDLERS[kind] = fn
+    return fn
+  return register
+
+
+def enqueue(kind, payload=None, key=None, delay=0, max_attempts=None):
+  # -> False if a job with this idempotency key is already kept
+  values = {
+    "kind": kind,
+    "payload": json.dumps(payload or {}),
+    "key": key,
+    "status": QUEUED,
+    "attempts": 0,
+    "max_attempts": max_attempts or app.config["JOB_MAX_ATTEMPTS"],
+    "run_at": datetime.today() + timedelta(seconds=delay),
+  }
+  if key is not None:
+    # a single statement: checking for the key first would race another
+    # enqueue and fail the caller's commit on the unique index
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+      inserted = db.session.execute(pg_insert(Job.__table__).values(**values)
+        .on_conflict_do_nothing(index_elements=[Job.key]))
+      return inserted.rowcount == 1
+    if dialect == "sqlite":
+      inserted = db.session.execute(Job.__table__.insert().values(**values).prefix_with("OR IGNORE"))
+      return inserted.rowcount == 1
+    if db.session.query(Job.id).filter(Job.key == key).first() is not None:
+      return False
+  db.session.add(Job(**values))
+  return True
+
+
+def _due(now):
+  stale = now - timedelta(seconds=app.config["JOB_TIMEOUT"])
+  return or_(
+    and_(Job.status == QUEUED, Job.run_at <= now),
+    and_(Job.status == RUNNING, Job.locked_at < stale),
+  )
+
+
+def claim(worker):
+  # -> the next due Job, now RUNNING and owned by worker, or None
+  while True:
+    now = datetime.today()
+    row = db.session.query(Job.id).filter(_due(now)) \
+      .order_by(Job.run_at, Job.id) \
+      .limit(1).with_for_update(skip_locked=True).first()
+    if row is None:
+      db.session.rollback()
+      return None
+    # the same condition again: without SKIP LOCKED (SQLite) another
+    # worker may have taken the row in between
+    claimed = db.session.query(Job).filter(Job.id == row.id, _due(now)).update({
+      "status": RUNNING,
+      "locked_at": now,
+      "locked_by": worker,
+      "attempts": Job.attempts + 1,
+    }, synchronize_session=False)
+    db.session.commit()
+    if claimed:
+      return Job.query.get(row.id)
+
+
+def _finish(id, worker, **values):
+  # a no-op if another worker has taken the job over meanwhile
+  db.session.query(Job).filter(Job.id == id, Job.locked_by == worker) \
+    .update(values, synchronize_session=False)
+  db.session.commit()
+
+
+def execute(job):
+  id, kind, worker = job.id, job.kind, job.locked_by
+  attempts, max_attempts = job.attempts, job.max_attempts
+  fn = HANDLERS.get(kind)
+  try:
+    if fn is None:
+      raise PermanentError(f"no handler for {kind!r}")
+    if attempts > max_attempts:
+      raise PermanentError("timed out")
+    result = fn(json.loads(job.payload))
+    db.session.commit()
+  except Exception as error:
+    db.session.rollback()
+    message = "".join(traceback.format_exception_only(type(error), error)).strip()
+    if isinstance(error, PermanentError) or attempts >= max_attempts:
+      app.logger.error(f"job {id} ({kind}) failed after {attempts} attempts: {message}")
+      _finish(id, worker, status=FAILED, last_error=message, finished_at=datetime.today())
+    else:
+      delay = app.config["JOB_RETRY_DELAY"] * 2 ** (attempts - 1)
+      _finish(id, worker, status=QUEUED, last_error=message, locked_at=None, locked_by=None,
+              run_at=datetime.today() + timedelta(seconds=delay))
+    return False
+  _finish(id, worker, status=DONE, result=None if result is None else json.dumps(result),
+          finished_at=datetime.today())
+  return True
+
+
+def stats():
+  # -> {status: count}
+  return dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status))
+
+
+def purge(before):
+  # finished jobs, and with them their idempotency keys
+  deleted = db.session.query(Job) \
+    .filter(Job.status.in_([DONE, FAILED]), Job.finished_at < before) \
+    .delete(synchronize_session=False)
+  db.session.commit()
+  return deleted
+
+#----------------------------------------------------------------------------#
+# Workers.
+#----------------------------------------------------------------------------#
+
+class Worker(object):
+  # A pool of threads, each claiming and running one job at a time with
+  # its own session. SIGINT/SIGTERM let running jobs finish, then stop.
+  def __init__(self, threads=None, poll=None, once=False):
+    self.threads = threads or app.config["JOB_THREADS"]
+    self.poll = poll or app.config["JOB_POLL_SECONDS"]
+    self.once = once
+    self.name = f"{socket.gethostname()}:{os.getpid()}"
+    self.stopping = threading.Event()
+
+  def stop(self, *args):
+    self.stopping.set()
+
+  def loop(self, n):
+    worker = f"{self.name}:{n}"
+    with app.app_context():
+      while not self.stopping.is_set():
+        try:
+          job = claim(worker)
+        except Exception:
+          db.session.rollback()
+          app.logger.exception("claiming a job failed")
+          job = None
+        if job is not None:
+          id = job.id
+          try:
+            execute(job)
+          except Exception:
+            # recording the outcome failed; the job is taken over once
+            # JOB_TIMEOUT has passed
+            db.session.rollback()
+            app.logger.exception(f"running job {id} failed")
+        elif self.once:
+          break
+        else:
+          self.stopping.wait(self.poll)
+        db.session.remove()
+
+  def run(self):
+    if threading.current_thread() is threading.main_thread():
+      signal.signal(signal.SIGINT, self.stop)
+      signal.signal(signal.SIGTERM, self.stop)
+    threads = [threading.Thread(target=self.loop, args=(n,), name=f"worker-{n}")
+               for n in range(self.threads)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+
+def _process(threads, poll, once):
+  Worker(threads, poll, once).run()
+
+
+def run(processes=None, threads=None, poll=None, once=False):
+  # processes > 1 starts fresh interpreters (spawn), each with its own
+  # engine and pool; size the pool for `threads` connections
+  processes = processes or app.config["JOB_PROCESSES"]
+  if processes <= 1:
+    return Worker(threads, poll, once).run()
+  context = multiprocessing.get_context("spawn")
+  children = [context.Process(target=_process, args=(threads, poll, once)) for _ in range(processes)]
+  for child in children:
+    child.start()
+  stop = lambda *args: [child.terminate() for child in children if child.is_alive()]
+  # children get SIGINT from the terminal themselves; SIGTERM is passed on
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  signal.signal(signal.SIGTERM, stop)
+  for child in children:
+    child.join()
+
+#----------------------------------------------------------------------------#
+# Handlers.
+#----------------------------------------------------------------------------#
+
+@handler("counters.recount")
+def recount(payload):
+  counters.recount(venue_ids=payload.get("venue_ids"), artist_ids=payload.get("artist_ids"))
+  db.session.commit()
+  cache.invalidate("venues", "artists")
+
+
+@handler("geo.locate_city")
+def locate_city(payload):
+  import geo
+  placed = geo.locate_city(payload["city_id"])
+  db.session.commit()
+  if placed:
+    cache.invalidate("venues")
+  return {"venues": placed}
+
+
+def _check_host(link):
+  # Links are user input: only http(s), and only to public addresses, so a
+  # link cannot make the worker probe the internal network. Every address
+  # the name resolves to is checked.
+  url = urllib.parse.urlsplit(link)
+  if url.scheme not in ("http", "https") or not url.hostname:
+    raise PermanentError(f"not an http(s) URL: {link!r}")
+  try:
+    port = url.port or (443 if url.scheme == "https" else 80)
+  except ValueError as error:
+    raise PermanentError(f"not a URL: {link!r}") from error
+  # resolver failures are network errors, and retried
+  addresses = socket.getaddrinfo(url.hostname, port, proto=socket.IPPROTO_TCP)
+  for *_, sockaddr in addresses:
+    address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+    if not address.is_global or address.is_multicast:
+      raise PermanentError(f"{url.hostname} resolves to a non-public address ({address})")
+
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+  # redirects are followed only to hosts _check_host() accepts
+  def redirect_request(self, req, fp, code, msg, headers, newurl):
+    _check_host(newurl)
+    return super(_CheckedRedirects, self).redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(_CheckedRedirects)
+
+
+@handler("links.check")
+def check_image_link(payload):
+  # HEAD the image link; 5xx and network errors are retried, anything
+  # else is the answer
+  model = {"venue": Venue, "artist": Artist}[payload["kind"]]
+  link = db.session.query(model.image_link).filter(model.id == payload["id"]).scalar()
+  if not link:
+    return None
+  _check_host(link)
+  request = urllib.request.Request(link, method="HEAD", headers={"User-Agent": "fyyur-link-check"})
+  try:
+    with _opener.open(request, timeout=app.config["JOB_LINK_TIMEOUT"]) as response:
+      status = response.status
+  except urllib.error.HTTPError as error:
+    if error.code >= 500 or error.code == 429:
+      raise
+    status = error.code
+  except ValueError as error:
+    raise PermanentError(f"not a URL: {link!r}") from error
+  if status >= 400:
+    app.logger.warning(f"{payload['kind']} {payload['id']}: image link {link} answered {status}")
+  return {"link": link, "status": status}
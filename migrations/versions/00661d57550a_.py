@@ -0,0 +1,36 @@
+"""updated_at watermarks for incremental exports
+
+Revision ID: 00661d57550a
+Revises: 9efabe25bbb5
+Create Date: 2026-10-18 13:20:44.187203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '00661d57550a'
+down_revision = '9efabe25bbb5'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['Venue', 'Artist', 'Show']
+
+
+def upgrade():
+    # SQLite cannot ALTER TABLE ADD COLUMN with a non-constant default
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate=recreate) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                          server_default=sa.func.now()))
+        op.create_index('ix_%s_updated_at' % table, table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index('ix_%s_updated_at' % table, table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
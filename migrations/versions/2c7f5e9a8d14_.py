@@ -0,0 +1,43 @@
+"""background job queue
+
+Revision ID: 2c7f5e9a8d14
+Revises: 4d2e8a61f0b3
+Create Date: 2026-10-18 19:27:51.884310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7f5e9a8d14'
+down_revision = '4d2e8a61f0b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=64), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+    sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_by', sa.String(length=120), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_Job_status_run_at', 'Job', ['status', 'run_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Job_status_run_at', table_name='Job')
+    op.drop_table('Job')
@@ -0,0 +1,34 @@
+"""show, venue and city lookup indexes
+
+Revision ID: 3f804b40dc04
+Revises: ef0bba623e1b
+Create Date: 2026-10-18 11:47:06.213954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f804b40dc04'
+down_revision = 'ef0bba623e1b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.create_index('ix_Venue_city_id', 'Venue', ['city_id'], unique=False)
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.create_index('ix_City_lower_name', 'City', [sa.text('lower(name)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_City_lower_name', table_name='City')
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.drop_index('ix_Venue_city_id', table_name='Venue')
+    op.drop_index('ix_Show_start_time', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,37 @@
+"""venue and city coordinates
+
+Revision ID: 4d2e8a61f0b3
+Revises: b81f0c9d3e27
+Create Date: 2026-10-18 18:12:09.530117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d2e8a61f0b3'
+down_revision = 'b81f0c9d3e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled in by `flask geocode`
+    op.add_column('City', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('City', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_Venue_geohash', 'Venue', ['geohash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_geohash', table_name='Venue')
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
+    with op.batch_alter_table('City') as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
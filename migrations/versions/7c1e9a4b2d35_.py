@@ -0,0 +1,88 @@
+"""show end times and double-booking exclusion constraints
+
+Revision ID: 7c1e9a4b2d35
+Revises: e55dc0175995
+Create Date: 2026-10-18 16:20:11.402518
+
+"""
+from datetime import timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e9a4b2d35'
+down_revision = 'e55dc0175995'
+branch_labels = None
+depends_on = None
+
+
+DEFAULT_MINUTES = 120
+
+EXCLUSIONS = [
+    ('ex_Show_venue_id_overlap', 'venue_id'),
+    ('ex_Show_artist_id_overlap', 'artist_id'),
+]
+
+
+def _backfill_postgres(bind):
+    # Existing shows get the default duration, cut short where the next
+    # show of the same venue or artist begins, so the new constraints hold
+    # for data that was booked before they existed.
+    bind.execute(sa.text('''
+        UPDATE "Show" s SET end_time = LEAST(
+            s.start_time + make_interval(mins => :minutes), n.next_venue, n.next_artist)
+        FROM (SELECT id,
+                lead(start_time) OVER (PARTITION BY venue_id ORDER BY start_time, id) AS next_venue,
+                lead(start_time) OVER (PARTITION BY artist_id ORDER BY start_time, id) AS next_artist
+              FROM "Show") n
+        WHERE n.id = s.id
+    '''), minutes=DEFAULT_MINUTES)
+
+
+def _backfill(bind):
+    rows = bind.execute(sa.text(
+        'SELECT id, venue_id, artist_id, start_time FROM "Show" ORDER BY start_time, id'
+    ).columns(start_time=sa.DateTime())).fetchall()
+    end = {}
+    last = {}
+    for id, venue_id, artist_id, start_time in rows:
+        end[id] = start_time + timedelta(minutes=DEFAULT_MINUTES)
+        for key in (('venue', venue_id), ('artist', artist_id)):
+            if key in last:
+                previous = last[key]
+                end[previous] = min(end[previous], start_time)
+            last[key] = id
+    update = sa.text('UPDATE "Show" SET end_time = :end_time WHERE id = :id')
+    for id, end_time in end.items():
+        bind.execute(update, id=id, end_time=end_time)
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if bind.dialect.name == 'postgresql':
+        _backfill_postgres(bind)
+    else:
+        _backfill(bind)
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_Show_end_time', 'end_time >= start_time')
+    if bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for name, column in EXCLUSIONS:
+            op.execute(
+                'ALTER TABLE "Show" ADD CONSTRAINT "%s" '
+                'EXCLUDE USING gist (%s WITH =, tsrange(start_time, end_time) WITH &&)' % (name, column)
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for name, _ in EXCLUSIONS:
+            op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "%s"' % name)
+        op.drop_constraint('ck_Show_end_time', 'Show', type_='check')
+    # on SQLite the table copy leaves the unreflected check constraint behind
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
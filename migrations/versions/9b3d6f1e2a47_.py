@@ -0,0 +1,27 @@
+"""artist keyset index on coalesce(name, '')
+
+Revision ID: 9b3d6f1e2a47
+Revises: 2c7f5e9a8d14
+Create Date: 2026-10-18 21:14:08.562390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3d6f1e2a47'
+down_revision = '2c7f5e9a8d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Artist.name is nullable: the keyset orders by coalesce(name, '')
+    op.create_index('ix_Artist_sort_name_id', 'Artist', [sa.text("coalesce(name, '')"), 'id'], unique=False)
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+
+
+def downgrade():
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.drop_index('ix_Artist_sort_name_id', table_name='Artist')
@@ -0,0 +1,40 @@
+"""unique city key on (lower(name), state)
+
+Revision ID: 9efabe25bbb5
+Revises: 3f804b40dc04
+Create Date: 2026-10-18 12:31:18.550871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9efabe25bbb5'
+down_revision = '3f804b40dc04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fold duplicate cities created by concurrent submissions into the
+    # oldest row before the unique index can be built
+    op.execute('''
+        UPDATE "Venue" SET city_id = (
+            SELECT MIN(c2.id) FROM "City" c1
+            JOIN "City" c2 ON lower(c2.name) = lower(c1.name) AND c2.state = c1.state
+            WHERE c1.id = "Venue".city_id)
+        WHERE city_id IN (SELECT id FROM "City" WHERE state IS NOT NULL)
+    ''')
+    op.execute('''
+        DELETE FROM "City" WHERE state IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM "City" WHERE state IS NOT NULL
+            GROUP BY lower(name), state)
+    ''')
+    op.drop_index('ix_City_lower_name', table_name='City')
+    op.create_index('ix_City_lower_name_state', 'City', [sa.text('lower(name)'), 'state'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_City_lower_name_state', table_name='City')
+    op.create_index('ix_City_lower_name', 'City', [sa.text('lower(name)')], unique=False)
@@ -0,0 +1,38 @@
+"""prefix indexes for the show form typeahead
+
+Revision ID: a4c8e2f71b96
+Revises: 9b3d6f1e2a47
+Create Date: 2026-10-18 22:03:47.915530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c8e2f71b96'
+down_revision = '9b3d6f1e2a47'
+branch_labels = None
+depends_on = None
+
+
+PREFIX_INDEXES = [
+    ('ix_Venue_lower_name_prefix', 'Venue'),
+    ('ix_Artist_lower_name_prefix', 'Artist'),
+]
+
+
+def upgrade():
+    # lower(name) LIKE 'term%' is a B-tree range scan only with
+    # text_pattern_ops (unless the database collation is C); SQLite scans.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table in PREFIX_INDEXES:
+        op.execute('CREATE INDEX "%s" ON "%s" (lower(name) text_pattern_ops)' % (name, table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table in PREFIX_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,140 @@
+"""partition Show by month of start_time
+
+Revision ID: b81f0c9d3e27
+Revises: 7c1e9a4b2d35
+Create Date: 2026-10-18 17:05:43.118204
+
+"""
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f0c9d3e27'
+down_revision = '7c1e9a4b2d35'
+branch_labels = None
+depends_on = None
+
+
+# monthly partitions are created up to this many months ahead of today;
+# `flask shows partitions` keeps the window rolling
+AHEAD = 3
+
+EXCLUSIONS = [
+    ('venue_id_overlap', 'venue_id'),
+    ('artist_id_overlap', 'artist_id'),
+]
+
+INDEXES = [
+    ('ix_Show_start_time', 'start_time'),
+    ('ix_Show_updated_at', 'updated_at'),
+    ('ix_Show_venue_id_start_time', 'venue_id, start_time'),
+    ('ix_Show_artist_id_start_time', 'artist_id, start_time'),
+]
+
+
+def _add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _exclusions(table):
+    for suffix, column in EXCLUSIONS:
+        op.execute(
+            'ALTER TABLE "%s" ADD CONSTRAINT "ex_%s_%s" '
+            'EXCLUDE USING gist (%s WITH =, tsrange(start_time, end_time) WITH &&)'
+            % (table, table, suffix, column)
+        )
+
+
+def _sequence(bind):
+    return bind.execute(sa.text("SELECT pg_get_serial_sequence('\"Show\"', 'id')")).scalar()
+
+
+def upgrade():
+    # Range partitioning is Postgres only; elsewhere "Show" stays a plain table.
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    sequence = _sequence(bind)
+    op.execute('ALTER SEQUENCE %s OWNED BY NONE' % sequence)
+    # The partition key must be part of the primary key; ids still come
+    # from the one sequence and stay unique.
+    op.execute('''
+        CREATE TABLE "Show_partitioned" (
+            id integer NOT NULL DEFAULT nextval('%s'::regclass),
+            artist_id integer NOT NULL,
+            venue_id integer NOT NULL,
+            start_time timestamp without time zone NOT NULL,
+            end_time timestamp without time zone NOT NULL,
+            updated_at timestamp without time zone NOT NULL DEFAULT now(),
+            CONSTRAINT "Show_partitioned_pkey" PRIMARY KEY (id, start_time),
+            CONSTRAINT "ck_Show_end_time" CHECK (end_time >= start_time)
+        ) PARTITION BY RANGE (start_time)
+    ''' % sequence)
+    first = bind.execute(sa.text('SELECT min(start_time) FROM "Show"')).scalar()
+    today = datetime.today()
+    month = date((first or today).year, (first or today).month, 1)
+    last = _add_months(date(today.year, today.month, 1), AHEAD)
+    partitions = []
+    while month <= last:
+        table = 'Show_p%s' % month.strftime('%Y%m')
+        op.execute(
+            'CREATE TABLE "%s" PARTITION OF "Show_partitioned" '
+            "FOR VALUES FROM ('%s') TO ('%s')" % (table, month, _add_months(month, 1))
+        )
+        partitions.append(table)
+        month = _add_months(month, 1)
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show_partitioned" DEFAULT')
+    partitions.append('Show_default')
+    op.execute('''
+        INSERT INTO "Show_partitioned" (id, artist_id, venue_id, start_time, end_time, updated_at)
+        SELECT id, artist_id, venue_id, start_time, end_time, updated_at FROM "Show"
+    ''')
+    op.execute('DROP TABLE "Show"')
+    op.execute('ALTER TABLE "Show_partitioned" RENAME TO "Show"')
+    op.execute('ALTER INDEX "Show_partitioned_pkey" RENAME TO "Show_pkey"')
+    op.execute('ALTER SEQUENCE %s OWNED BY "Show".id' % sequence)
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'])
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'])
+    for name, columns in INDEXES:
+        op.execute('CREATE INDEX "%s" ON "Show" (%s)' % (name, columns))
+    # Postgres cannot enforce an exclusion constraint across partitions, so
+    # each partition gets its own (see partitions.py and scheduling.lock).
+    for table in partitions:
+        _exclusions(table)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    sequence = _sequence(bind)
+    op.execute('ALTER SEQUENCE %s OWNED BY NONE' % sequence)
+    op.execute('''
+        CREATE TABLE "Show_plain" (
+            id integer NOT NULL DEFAULT nextval('%s'::regclass),
+            artist_id integer NOT NULL,
+            venue_id integer NOT NULL,
+            start_time timestamp without time zone NOT NULL,
+            end_time timestamp without time zone NOT NULL,
+            updated_at timestamp without time zone NOT NULL DEFAULT now(),
+            CONSTRAINT "Show_plain_pkey" PRIMARY KEY (id),
+            CONSTRAINT "ck_Show_end_time" CHECK (end_time >= start_time)
+        )
+    ''' % sequence)
+    # rows of detached (archived) partitions are not brought back
+    op.execute('''
+        INSERT INTO "Show_plain" (id, artist_id, venue_id, start_time, end_time, updated_at)
+        SELECT id, artist_id, venue_id, start_time, end_time, updated_at FROM "Show"
+    ''')
+    op.execute('DROP TABLE "Show"')
+    op.execute('ALTER TABLE "Show_plain" RENAME TO "Show"')
+    op.execute('ALTER INDEX "Show_plain_pkey" RENAME TO "Show_pkey"')
+    op.execute('ALTER SEQUENCE %s OWNED BY "Show".id' % sequence)
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'])
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'])
+    for name, columns in INDEXES:
+        op.execute('CREATE INDEX "%s" ON "Show" (%s)' % (name, columns))
+    _exclusions('Show')
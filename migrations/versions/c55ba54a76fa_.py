@@ -0,0 +1,44 @@
+"""trigram search indexes
+
+Revision ID: c55ba54a76fa
+Revises: c666a2d14d2a
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c55ba54a76fa'
+down_revision = 'c666a2d14d2a'
+branch_labels = None
+depends_on = None
+
+
+TRIGRAM_INDEXES = [
+    ('ix_venue_name_trgm', 'Venue', 'name'),
+    ('ix_venue_genres_trgm', 'Venue', 'genres'),
+    ('ix_city_name_trgm', 'City', 'name'),
+    ('ix_artist_name_trgm', 'Artist', 'name'),
+    ('ix_artist_city_trgm', 'Artist', 'city'),
+    ('ix_artist_genres_trgm', 'Artist', 'genres'),
+]
+
+
+def upgrade():
+    # GIN trigram indexes serve both ILIKE '%term%' and the % similarity
+    # operator used by search.py; other dialects use its in-memory index.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        op.create_index(name, table, [column], postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table, column in TRIGRAM_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,49 @@
+"""denormalized show counters
+
+Revision ID: e55dc0175995
+Revises: 00661d57550a
+Create Date: 2026-10-18 14:02:37.664013
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e55dc0175995'
+down_revision = '00661d57550a'
+branch_labels = None
+depends_on = None
+
+
+OWNERS = [('Venue', 'venue_id'), ('Artist', 'artist_id')]
+
+
+def upgrade():
+    op.create_table('Checkpoint',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('value', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    now = datetime.today()
+    for table, owner_id in OWNERS:
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.get_bind().execute(sa.text('''
+            UPDATE "%(table)s" SET
+                past_shows_count = (SELECT count(*) FROM "Show"
+                    WHERE "Show".%(owner_id)s = "%(table)s".id AND "Show".start_time < :now),
+                upcoming_shows_count = (SELECT count(*) FROM "Show"
+                    WHERE "Show".%(owner_id)s = "%(table)s".id AND "Show".start_time >= :now)
+        ''' % {'table': table, 'owner_id': owner_id}), now=now)
+    op.bulk_insert(sa.table('Checkpoint', sa.column('name'), sa.column('value')),
+                   [{'name': 'counters', 'value': now}])
+
+
+def downgrade():
+    for table, owner_id in OWNERS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('upcoming_shows_count')
+            batch_op.drop_column('past_shows_count')
+    op.drop_table('Checkpoint')
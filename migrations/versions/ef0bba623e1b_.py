@@ -0,0 +1,85 @@
+"""normalize genres into Genre + association tables
+
+Revision ID: ef0bba623e1b
+Revises: c55ba54a76fa
+Create Date: 2026-10-18 11:04:52.918337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ef0bba623e1b'
+down_revision = 'c55ba54a76fa'
+branch_labels = None
+depends_on = None
+
+
+OWNERS = [
+    ('Venue', 'venue_genres', 'venue_id'),
+    ('Artist', 'artist_genres', 'artist_id'),
+]
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for owner, association, owner_id in OWNERS:
+        op.create_table(association,
+        sa.Column(owner_id, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([owner_id], [owner + '.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ),
+        sa.PrimaryKeyConstraint(owner_id, 'genre_id')
+        )
+        op.create_index('ix_%s_genre_id_%s' % (association, owner_id),
+                        association, ['genre_id', owner_id])
+
+    # data migration: split the comma-joined strings into rows
+    bind = op.get_bind()
+    split = {}
+    for owner, association, owner_id in OWNERS:
+        rows = bind.execute(sa.text('SELECT id, genres FROM "%s"' % owner))
+        split[owner] = [
+            (id, list(dict.fromkeys(g.strip() for g in (genres or '').split(',') if g.strip())))
+            for id, genres in rows
+        ]
+    names = sorted(set(n for rows in split.values() for _, ns in rows for n in ns))
+    if names:
+        op.bulk_insert(genre, [{'name': n} for n in names])
+    ids = dict((name, id) for id, name in bind.execute(sa.text('SELECT id, name FROM "Genre"')))
+    for owner, association, owner_id in OWNERS:
+        table = sa.table(association, sa.column(owner_id), sa.column('genre_id'))
+        rows = [{owner_id: id, 'genre_id': ids[n]} for id, ns in split[owner] for n in ns]
+        if rows:
+            op.bulk_insert(table, rows)
+        # also drops the trigram index on the column from c55ba54a76fa
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    bind = op.get_bind()
+    for owner, association, owner_id in OWNERS:
+        with op.batch_alter_table(owner) as batch_op:
+            batch_op.add_column(sa.Column('genres', sa.String(length=120), nullable=True))
+        joined = {}
+        rows = bind.execute(sa.text(
+            'SELECT a.%s, g.name FROM %s a JOIN "Genre" g ON g.id = a.genre_id ORDER BY g.name'
+            % (owner_id, association)))
+        for id, name in rows:
+            joined.setdefault(id, []).append(name)
+        for id, names in joined.items():
+            bind.execute(sa.text('UPDATE "%s" SET genres = :genres WHERE id = :id' % owner),
+                         genres=','.join(names), id=id)
+        if bind.dialect.name == 'postgresql':
+            op.create_index('ix_%s_genres_trgm' % owner.lower(), owner, ['genres'],
+                            postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+        op.drop_index('ix_%s_genre_id_%s' % (association, owner_id), table_name=association)
+        op.drop_table(association)
+    op.drop_table('Genre')
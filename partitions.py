@@ -0,0 +1,111 @@
+from datetime import date
+from sqlalchemy import text
+from app import db
+from scheduling import EXCLUSIONS
+
+#----------------------------------------------------------------------------#
+# Monthly partitions of "Show" (Postgres).
+#----------------------------------------------------------------------------#
+
+# "Show" is range partitioned on start_time, one partition per month
+# ("Show_p202610") plus "Show_default" for anything outside them. Queries
+# bounded on start_time (upcoming shows, /shows?from=&to=, calendars) only
+# scan the partitions of their window. Exclusion constraints cannot span
+# partitions, so each partition carries its own; bookings that cross a
+# month boundary are covered by the row locks in scheduling.lock().
+
+DEFAULT = "Show_default"
+
+
+def month_start(value):
+  return date(value.year, value.month, 1)
+
+
+def add_months(month, n):
+  index = month.year * 12 + month.month - 1 + n
+  return date(index // 12, index % 12 + 1, 1)
+
+
+def name(month):
+  return f"Show_p{month:%Y%m}"
+
+
+def is_partitioned():
+  if db.engine.dialect.name != "postgresql":
+    return False
+  return db.session.execute(text(
+    "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+    "WHERE c.relname = 'Show'"
+  )).first() is not None
+
+
+def attached():
+  # -> {month: name} of the attached monthly partitions
+  rows = db.session.execute(text(
+    "SELECT c.relname FROM pg_inherits i "
+    "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+    "WHERE p.relname = 'Show'"
+  ))
+  months = {}
+  for relname, in rows:
+    if relname.startswith("Show_p"):
+      months[date(int(relname[6:10]), int(relname[10:12]), 1)] = relname
+  return months
+
+
+def _add_exclusions(table):
+  for constraint, column in EXCLUSIONS:
+    db.session.execute(text(
+      f'ALTER TABLE "{table}" ADD CONSTRAINT "{constraint.replace("Show", table, 1)}" '
+      f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)'
+    ))
+
+
+def create(month):
+  # Rows already sitting in the default partition for this month are
+  # moved into the new partition; the default is detached meanwhile
+  # because Postgres refuses to add a partition that overlaps its rows.
+  table, lower, upper = name(month), month, add_months(month, 1)
+  bounds = {"lower": lower, "upper": upper}
+  stray = db.session.execute(text(
+    f'SELECT 1 FROM "{DEFAULT}" WHERE start_time >= :lower AND start_time < :upper LIMIT 1'
+  ), bounds).first() is not None
+  if stray:
+    db.session.execute(text(f'ALTER TABLE "Show" DETACH PARTITION "{DEFAULT}"'))
+  db.session.execute(text(
+    f'CREATE TABLE "{table}" PARTITION OF "Show" FOR VALUES FROM (\'{lower}\') TO (\'{upper}\')'
+  ))
+  _add_exclusions(table)
+  if stray:
+    db.session.execute(text(
+      f'INSERT INTO "{table}" SELECT * FROM "{DEFAULT}" WHERE start_time >= :lower AND start_time < :upper'
+    ), bounds)
+    db.session.execute(text(
+      f'DELETE FROM "{DEFAULT}" WHERE start_time >= :lower AND start_time < :upper'
+    ), bounds)
+    db.session.execute(text(f'ALTER TABLE "Show" ATTACH PARTITION "{DEFAULT}" DEFAULT'))
+  return table
+
+
+def ensure(today, ahead=3):
+  # partitions for the current month and `ahead` months after it
+  existing = attached()
+  created = []
+  for n in range(ahead + 1):
+    month = add_months(month_start(today), n)
+    if month not in existing:
+      created.append(create(month))
+  db.session.commit()
+  return created
+
+
+def detach_before(cutoff):
+  # Detached partitions stay in the database as plain tables (the cold
+  # archive) but are no longer read by the app.
+  detached = []
+  for month, table in sorted(attached().items()):
+    if add_months(month, 1) <= month_start(cutoff):
+      db.session.execute(text(f'ALTER TABLE "Show" DETACH PARTITION "{table}"'))
+      detached.append(table)
+  db.session.commit()
+  return detached
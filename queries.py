@@ -0,0 +1,281 @@
+import base64
+import calendar
+import json
+from itertools import groupby
+from sqlalchemy import func, and_, or_, literal_column
+from sqlalchemy.orm import joinedload, selectinload
+from app import db, City, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from partitions import add_months
+
+#----------------------------------------------------------------------------#
+# Read paths.
+#----------------------------------------------------------------------------#
+
+def venue_detail(venue_id):
+  # Venue + City + genres in one joined query, Show + Artist in one
+  # selectin query.
+  venue = Venue.query.options(
+    joinedload(Venue.city_parent),
+    joinedload(Venue.genres),
+    selectinload(Venue.shows).joinedload(Show.artist),
+  ).filter(Venue.id == venue_id).first()
+  if venue is None:
+    return None
+  return venue.get_venue()
+
+
+def artist_detail(artist_id):
+  # Artist + genres in one joined query, Show + Venue in one selectin query.
+  artist = Artist.query.options(
+    joinedload(Artist.genres),
+    selectinload(Artist.shows).joinedload(Show.venue),
+  ).filter(Artist.id == artist_id).first()
+  if artist is None:
+    return None
+  return artist.get_artist()
+
+
+# Cached detail pages: (data, tags), shared by the Flask views and asgi.py.
+
+def venue_entry(venue_id):
+  data = venue_detail(venue_id)
+  tags = [f"venue:{venue_id}"]
+  if data:
+    tags.append(f"city:{data['city_id']}")
+    tags += [f"artist:{s['artist_id']}" for s in data["past_shows"] + data["upcoming_shows"]]
+  return data, tags
+
+
+def artist_entry(artist_id):
+  data = artist_detail(artist_id)
+  tags = [f"artist:{artist_id}"]
+  if data:
+    tags += [f"venue:{s['venue_id']}" for s in data["past_shows"] + data["upcoming_shows"]]
+  return data, tags
+
+
+def with_genre(query, owner_column, owner_id, genre):
+  # Genre.name (unique) -> genre_id -> (genre_id, owner_id) index range
+  if not genre:
+    return query
+  association = owner_column.table
+  return query.join(association, owner_column == owner_id) \
+    .join(Genre, Genre.id == association.c.genre_id) \
+    .filter(Genre.name == genre)
+
+
+def venue_areas(genre=None):
+  # City JOIN Venue skips empty cities; upcoming counts are read from the
+  # counter column instead of aggregating Show.
+  query = db.session.query(
+    City.id, City.name, City.state,
+    Venue.id, Venue.name, Venue.upcoming_shows_count,
+  ).join(Venue, Venue.city_id == City.id)
+  rows = with_genre(query, venue_genres.c.venue_id, Venue.id, genre) \
+   .order_by(City.name, City.id, Venue.id) \
+   .all()
+  return group_areas(rows)
+
+
+def group_areas(rows):
+  # (city_id, city, state, venue_id, name, count) rows in city order
+  areas = []
+  for (city_id, city, state), venues in groupby(rows, key=lambda r: r[:3]):
+    areas.append({
+      "city_id": city_id,
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue_id,
+        "name": name,
+        "num_upcoming_shows": count
+      } for _, _, _, venue_id, name, count in venues]
+    })
+  return areas
+
+
+def encode_cursor(*values):
+  raw = json.dumps(values, separators=(",", ":")).encode()
+  return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+  # malformed or tampered cursors fall back to the first page
+  if not cursor:
+    return None
+  try:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+  except (ValueError, TypeError):
+    return None
+
+
+def upcoming_show_counts(model, ids):
+  # counter columns for a batch of ids (see counters.py)
+  if not ids:
+    return {}
+  rows = db.session.query(model.id, model.upcoming_shows_count) \
+    .filter(model.id.in_(ids)) \
+    .all()
+  return dict(rows)
+
+
+# Artist.name is nullable; the keyset orders a missing name as "" (and is
+# served by the expression index ix_Artist_sort_name_id). The literal keeps
+# the expression identical to the index's, which SQLite requires.
+ARTIST_SORT_NAME = func.coalesce(Artist.name, literal_column("''"))
+
+
+def artist_key(cursor):
+  # -> [name, id] of a well-formed artist cursor, else None
+  key = decode_cursor(cursor)
+  if isinstance(key, list) and len(key) == 2 and isinstance(key[0], str) and type(key[1]) is int:
+    return key
+  return None
+
+
+def artist_page(after=None, before=None, per_page=50, genre=None):
+  # Keyset pagination on (name, id): each page is an index range scan,
+  # so page 1000 costs the same as page 1.
+  query = with_genre(
+    db.session.query(Artist.id, Artist.name, Artist.upcoming_shows_count),
+    artist_genres.c.artist_id, Artist.id, genre
+  )
+  key = artist_key(before) if before else artist_key(after)
+  backwards = bool(before) and key is not None
+  sort_name = ARTIST_SORT_NAME
+  if key is not None:
+    name, id = key
+    if backwards:
+      query = query.filter(or_(sort_name < name, and_(sort_name == name, Artist.id < id)))
+    else:
+      query = query.filter(or_(sort_name > name, and_(sort_name == name, Artist.id > id)))
+  if backwards:
+    query = query.order_by(sort_name.desc(), Artist.id.desc())
+  else:
+    query = query.order_by(sort_name, Artist.id)
+
+  rows = query.limit(per_page + 1).all()
+  return artist_page_result(rows, per_page, key, backwards)
+
+
+def artist_page_result(rows, per_page, key, backwards):
+  # (id, name, upcoming_shows_count) rows, one more than per_page if
+  # there is another page, in scan order
+  rows = list(rows)
+  has_more = len(rows) > per_page
+  rows = rows[:per_page]
+  if backwards:
+    rows.reverse()
+
+  artists = [{
+    "id": id,
+    "name": name,
+    "num_upcoming_shows": count
+  } for id, name, count in rows]
+
+  next_cursor = prev_cursor = None
+  if rows:
+    first, last = rows[0], rows[-1]
+    if has_more or backwards:
+      next_cursor = encode_cursor(last[1] or "", last[0])
+    if key is not None and (has_more or not backwards):
+      prev_cursor = encode_cursor(first[1] or "", first[0])
+  return {
+    "artists": artists,
+    "next_cursor": next_cursor,
+    "prev_cursor": prev_cursor
+  }
+
+
+class ShowFeed(object):
+  # Iterated lazily by the streamed template; next_after is only known
+  # once the loop over the page has finished.
+  def __init__(self, query, per_page):
+    self.query = query
+    self.per_page = per_page
+    self.has_more = False
+    self.next_after = None
+
+  def __iter__(self):
+    # the extra (per_page + 1)th row only signals another page; the result
+    # is always consumed to the end so the server-side cursor is released
+    for i, row in enumerate(self.query.limit(self.per_page + 1).yield_per(500)):
+      if i == self.per_page:
+        self.has_more = True
+      else:
+        self.next_after = row.id
+        yield row
+
+
+def show_feed(start=None, end=None, venue_id=None, artist_id=None, after=None, per_page=500):
+  # Only the columns the tiles render, Artist and Venue joined in the same query.
+  query = db.session.query(
+    Show.id,
+    Show.venue_id,
+    Venue.name.label("venue_name"),
+    Show.artist_id,
+    Artist.name.label("artist_name"),
+    Artist.image_link.label("artist_image_link"),
+    Show.start_time,
+    # fragment cache versions of the tile
+    Show.updated_at,
+    Venue.updated_at.label("venue_updated_at"),
+    Artist.updated_at.label("artist_updated_at"),
+  ).join(Venue, Venue.id == Show.venue_id) \
+   .join(Artist, Artist.id == Show.artist_id)
+  if start is not None:
+    query = query.filter(Show.start_time >= start)
+  if end is not None:
+    query = query.filter(Show.start_time < end)
+  if venue_id is not None:
+    query = query.filter(Show.venue_id == venue_id)
+  if artist_id is not None:
+    query = query.filter(Show.artist_id == artist_id)
+  if after is not None:
+    query = query.filter(Show.id > after)
+  return ShowFeed(query.order_by(Show.id), per_page)
+
+
+def city_calendar(city_id, month):
+  # One month of a city's shows as a Monday-first grid of weeks. Bounded
+  # on start_time, so on Postgres only that month's partition is scanned.
+  city = db.session.query(City.id, City.name, City.state).filter(City.id == city_id).first()
+  if city is None:
+    return None
+  end = add_months(month, 1)
+  rows = db.session.query(
+    Show.id, Show.start_time, Show.end_time,
+    Show.venue_id, Venue.name, Show.artist_id, Artist.name,
+  ).join(Venue, Venue.id == Show.venue_id) \
+   .join(Artist, Artist.id == Show.artist_id) \
+   .filter(Venue.city_id == city_id) \
+   .filter(Show.start_time >= month, Show.start_time < end) \
+   .order_by(Show.start_time, Show.id) \
+   .all()
+  days = {}
+  for id, start_time, end_time, venue_id, venue_name, artist_id, artist_name in rows:
+    days.setdefault(start_time.date(), []).append({
+      "id": id,
+      "start_time": start_time,
+      "end_time": end_time,
+      "venue_id": venue_id,
+      "venue_name": venue_name,
+      "artist_id": artist_id,
+      "artist_name": artist_name,
+    })
+  weeks = [[{
+    "date": day,
+    "in_month": day.month == month.month,
+    "shows": days.get(day, []),
+  } for day in week] for week in calendar.Calendar().monthdatescalendar(month.year, month.month)]
+  return {
+    "city_id": city.id,
+    "city": city.name,
+    "state": city.state,
+    "month": month,
+    "previous": add_months(month, -1),
+    "next": end,
+    "count": len(rows),
+    "weeks": weeks,
+  }
@@ -0,0 +1,279 @@
+import copy
+import threading
+import time
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func
+from app import app, db, City, Venue, Artist, Show, venue_genres, artist_genres
+from geo import EARTH_RADIUS_KM
+
+#----------------------------------------------------------------------------#
+# "Artists you might book".
+#----------------------------------------------------------------------------#
+
+# Seeking artists are ranked for a venue by a weighted sum of
+#   genre     cosine of the artist's and the venue's genre sets
+#   location  1 in the venue's city, else distance decay between city
+#             coordinates, else 0.5 in the same state
+#   history   artists who played the venues that share artists with this
+#             one (item-based co-occurrence over the show history)
+# Artist genres and the venue x artist show counts are kept as sparse
+# matrices in every process. They are brought up to date incrementally,
+# from artists updated and shows inserted since the last refresh, and
+# rebuilt from scratch every RECOMMEND_REBUILD_SECONDS (which also picks
+# up deletions and rows a refresh could not see).
+
+
+class Model(object):
+  def __init__(self):
+    self.built_at = self.refreshed_at = time.monotonic()
+    self.artist_ids = np.zeros(0, dtype=np.int64)
+    self.artist_index = {}
+    self.genre_index = {}
+    self.genres = sparse.csr_matrix((0, 0))
+    self.seeking = np.zeros(0, dtype=bool)
+    self.city_ids = np.zeros(0, dtype=np.int64)
+    self.states = np.zeros(0, dtype=object)
+    self.lat = np.zeros(0)
+    self.lng = np.zeros(0)
+    self.venue_index = {}
+    self.shows = sparse.csr_matrix((0, 0))
+    self.artists_seen = None
+    self.max_show_id = 0
+
+  # Artists -----------------------------------------------------------------
+
+  def _artist_rows(self, since=None):
+    query = db.session.query(Artist.id, Artist.city, Artist.state, Artist.seeking_venue, Artist.updated_at)
+    if since is not None:
+      query = query.filter(Artist.updated_at >= since)
+    rows = query.order_by(Artist.id).all()
+    genres = {}
+    if rows:
+      links = db.session.query(artist_genres.c.artist_id, artist_genres.c.genre_id)
+      if since is not None:
+        links = links.filter(artist_genres.c.artist_id.in_([row.id for row in rows]))
+      for artist_id, genre_id in links:
+        genres.setdefault(artist_id, []).append(genre_id)
+    return rows, genres
+
+  def _genre_matrix(self, rows, genres):
+    # one L2-normalized row of genre columns per artist
+    indptr, indices, data = [0], [], []
+    for row in rows:
+      columns = [self.genre_index.setdefault(g, len(self.genre_index)) for g in genres.get(row.id, ())]
+      indices += columns
+      data += [1.0 / np.sqrt(len(columns))] * len(columns)
+      indptr.append(len(indices))
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), max(len(self.genre_index), 1)))
+
+  def _cities(self):
+    # City.key(name, state) -> (id, latitude, longitude); artists only
+    # have city names
+    return dict((City.key(name, state), (id, lat, lng)) for id, name, state, lat, lng in
+      db.session.query(City.id, City.name, City.state, City.latitude, City.longitude))
+
+  def _features(self, rows, cities):
+    located = [cities.get(City.key(row.city, row.state), (-1, None, None)) for row in rows]
+    return (
+      np.array([bool(row.seeking_venue) for row in rows], dtype=bool),
+      np.array([city[0] for city in located], dtype=np.int64),
+      np.array([row.state for row in rows], dtype=object),
+      np.array([np.nan if city[1] is None else city[1] for city in located], dtype=float),
+      np.array([np.nan if city[2] is None else city[2] for city in located], dtype=float),
+    )
+
+  def load_artists(self):
+    rows, genres = self._artist_rows()
+    self.artist_ids = np.array([row.id for row in rows], dtype=np.int64)
+    self.artist_index = dict((row.id, i) for i, row in enumerate(rows))
+    self.genres = self._genre_matrix(rows, genres)
+    self.seeking, self.city_ids, self.states, self.lat, self.lng = self._features(rows, self._cities())
+    self.artists_seen = max((row.updated_at for row in rows), default=None)
+
+  def update_artists(self):
+    # rows touched since the last load replace their old rows; new artists
+    # are appended
+    if self.artists_seen is None:
+      return self.load_artists()
+    rows, genres = self._artist_rows(since=self.artists_seen)
+    if not rows:
+      return
+    new = [row for row in rows if row.id not in self.artist_index]
+    for row in new:
+      self.artist_index[row.id] = len(self.artist_index)
+    n = len(self.artist_index)
+    self.artist_ids = np.concatenate([self.artist_ids, np.array([row.id for row in new], dtype=np.int64)])
+    positions = np.array([self.artist_index[row.id] for row in rows])
+    seeking, city_ids, states, lat, lng = self._features(rows, self._cities())
+    for name, values in (("seeking", seeking), ("city_ids", city_ids), ("states", states), ("lat", lat), ("lng", lng)):
+      column = getattr(self, name)
+      grown = np.resize(column, n) if len(column) < n else column.copy()
+      grown[positions] = values
+      setattr(self, name, grown)
+    changed = self._genre_matrix(rows, genres)
+    width = max(len(self.genre_index), 1)
+    base = self.genres.copy()
+    base.resize((n, width))
+    keep = np.ones(n)
+    keep[positions] = 0
+    placed = sparse.csr_matrix(
+      (np.ones(len(rows)), (positions, np.arange(len(rows)))), shape=(n, len(rows))
+    ).dot(changed)
+    placed.resize((n, width))
+    self.genres = (sparse.diags(keep).dot(base) + placed).tocsr()
+    self.artists_seen = max(self.artists_seen, max(row.updated_at for row in rows))
+    self._resize_shows()
+
+  # Shows -------------------------------------------------------------------
+
+  def _resize_shows(self):
+    shape = (len(self.venue_index), len(self.artist_index))
+    if self.shows.shape != shape:
+      self.shows = self.shows.copy()
+      self.shows.resize(shape)
+
+  def add_shows(self, after=0):
+    # venue x artist show counts, for show ids greater than `after`
+    rows = db.session.query(Show.venue_id, Show.artist_id, func.count(Show.id), func.max(Show.id)) \
+      .filter(Show.id > after) \
+      .group_by(Show.venue_id, Show.artist_id).all()
+    if not rows:
+      return
+    venues, artists, counts = [], [], []
+    for venue_id, artist_id, count, _ in rows:
+      if artist_id not in self.artist_index:
+        # an artist the last refresh did not see yet; the next rebuild adds it
+        continue
+      venues.append(self.venue_index.setdefault(venue_id, len(self.venue_index)))
+      artists.append(self.artist_index[artist_id])
+      counts.append(count)
+    self._resize_shows()
+    added = sparse.csr_matrix((np.array(counts, dtype=float), (venues, artists)), shape=self.shows.shape)
+    self.shows = (self.shows + added).tocsr()
+    self.max_show_id = max(self.max_show_id, max(row[3] for row in rows))
+
+  # Scoring -----------------------------------------------------------------
+
+  def _location(self, venue):
+    score = np.where(self.states == venue.state, 0.5, 0.0) if venue.state else np.zeros(len(self.artist_ids))
+    if venue.latitude is not None:
+      lat1, lng1 = np.radians(venue.latitude), np.radians(venue.longitude)
+      lat2, lng2 = np.radians(self.lat), np.radians(self.lng)
+      a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+      distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+      decay = np.exp(-distance / app.config["RECOMMEND_DISTANCE_KM"])
+      score = np.fmax(score, np.nan_to_num(decay))
+    return np.where(self.city_ids == venue.city_id, 1.0, score)
+
+  def _history(self, venue_id):
+    row = self.venue_index.get(venue_id)
+    if row is None or self.shows.nnz == 0:
+      return np.zeros(len(self.artist_ids))
+    # venue-venue overlap in artists, this venue itself left out
+    overlap = np.asarray(self.shows.dot(self.shows.getrow(row).T).todense()).ravel()
+    overlap[row] = 0
+    score = np.asarray(self.shows.T.dot(overlap)).ravel()
+    top = score.max() if len(score) else 0
+    return score / top if top > 0 else score
+
+  def recommend(self, venue, genre_ids, limit):
+    # -> [(artist_id, score, {component: score})], best first
+    if not len(self.artist_ids):
+      return []
+    columns = [self.genre_index[g] for g in genre_ids if g in self.genre_index]
+    query = np.zeros(self.genres.shape[1])
+    if columns:
+      query[columns] = 1.0 / np.sqrt(len(genre_ids))
+    parts = {
+      "genre": np.asarray(self.genres.dot(query)).ravel(),
+      "location": self._location(venue),
+      "history": self._history(venue.id),
+    }
+    weights = app.config["RECOMMEND_WEIGHTS"]
+    total = sum(weights[name] * values for name, values in parts.items())
+    total = np.where(self.seeking, total, -1.0)
+    if len(total) > limit:
+      candidates = np.argpartition(-total, limit)[:limit]
+    else:
+      candidates = np.arange(len(total))
+    ranked = candidates[np.lexsort((self.artist_ids[candidates], -total[candidates]))]
+    return [(
+      int(self.artist_ids[i]), float(total[i]),
+      dict((name, round(float(values[i]), 4)) for name, values in parts.items()),
+    ) for i in ranked if total[i] > 0]
+
+
+def build():
+  model = Model()
+  model.load_artists()
+  model.add_shows()
+  return model
+
+
+class NotReady(Exception):
+  # the first model of this process is still being built
+  pass
+
+
+_model = None
+_lock = threading.Lock()
+
+
+def _refresh():
+  # in a background thread, holding _lock
+  global _model
+  try:
+    with app.app_context():
+      try:
+        current = _model
+        now = time.monotonic()
+        if current is None or now - current.built_at >= app.config["RECOMMEND_REBUILD_SECONDS"]:
+          _model = build()
+        elif now - current.refreshed_at >= app.config["RECOMMEND_REFRESH_SECONDS"]:
+          fresh = copy.copy(current)
+          fresh.artist_index = dict(current.artist_index)
+          fresh.venue_index = dict(current.venue_index)
+          fresh.genre_index = dict(current.genre_index)
+          fresh.update_artists()
+          fresh.add_shows(after=current.max_show_id)
+          fresh.refreshed_at = now
+          _model = fresh
+      finally:
+        db.session.remove()
+  except Exception:
+    app.logger.exception("refreshing the recommendation model failed")
+  finally:
+    _lock.release()
+
+
+def model():
+  # -> the current model, or None before the first build has finished.
+  # Builds and refreshes run in a background thread, one at a time, and
+  # swap in a new model; requests keep scoring against the previous one
+  # meanwhile and never wait for the database.
+  current = _model
+  stale = current is None or time.monotonic() - current.refreshed_at >= app.config["RECOMMEND_REFRESH_SECONDS"]
+  if stale and _lock.acquire(blocking=False):
+    threading.Thread(target=_refresh, name="recommend-refresh", daemon=True).start()
+  return current
+
+
+def warm():
+  # build the first model now, in this thread (benchmarks, scripts)
+  _lock.acquire()
+  _refresh()
+
+
+def for_venue(venue_id, limit=20):
+  # -> None for an unknown venue, else [(artist_id, score, parts)]; raises
+  # NotReady until the first model is built
+  venue = db.session.query(Venue.id, Venue.city_id, Venue.state, Venue.latitude, Venue.longitude) \
+    .filter(Venue.id == venue_id).first()
+  if venue is None:
+    return None
+  current = model()
+  if current is None:
+    raise NotReady()
+  genre_ids = [id for id, in db.session.query(venue_genres.c.genre_id).filter(venue_genres.c.venue_id == venue_id)]
+  return current.recommend(venue, genre_ids, limit)
@@ -0,0 +1,97 @@
+import random
+import time
+from functools import wraps
+from flask import g, session, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+#----------------------------------------------------------------------------#
+# Read-replica routing.
+#----------------------------------------------------------------------------#
+
+def _writes(clause):
+  # INSERT/UPDATE/DELETE passed to session.execute(), and query.update()
+  # or .delete(); raw SQL unless it is a SELECT
+  if isinstance(clause, UpdateBase):
+    return True
+  if isinstance(clause, TextClause):
+    words = clause.text.split(None, 1)
+    return not words or words[0].upper() not in ("SELECT", "WITH")
+  return False
+
+
+class RoutingSession(SignallingSession):
+  # Views wrapped in @read_only read from a replica; writes, and every
+  # other view, go to the primary.
+  def get_bind(self, mapper=None, clause=None):
+    if has_request_context():
+      if self._flushing or _writes(clause):
+        g.db_wrote = True
+        return super(RoutingSession, self).get_bind(mapper, clause)
+      replica = g.get("db_replica")
+      if replica is not None:
+        return get_state(self.app).db.get_engine(self.app, bind=replica)
+    return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  def init_app(self, app):
+    app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for i, uri in enumerate(app.config["SQLALCHEMY_REPLICA_URIS"]):
+      binds[f"replica{i}"] = uri
+    app.config["SQLALCHEMY_BINDS"] = binds
+    app.config.setdefault("SQLALCHEMY_REPLICA_LAG_WINDOW", 5)
+    super(RoutingSQLAlchemy, self).init_app(app)
+
+    @app.after_request
+    def _pin_writer(response):
+      # read-your-writes: a client that just wrote reads from the primary
+      # until the replicas have had time to catch up
+      if g.pop("db_wrote", False) and app.config["SQLALCHEMY_REPLICA_URIS"]:
+        session["db_primary_until"] = time.time() + app.config["SQLALCHEMY_REPLICA_LAG_WINDOW"]
+      return response
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+  def replicas(self, app=None):
+    app = self.get_app(app)
+    return [f"replica{i}" for i in range(len(app.config["SQLALCHEMY_REPLICA_URIS"]))]
+
+  def use_replica(self):
+    # pick one replica for the rest of the request
+    replicas = self.replicas()
+    if not replicas or "db_replica" in g:
+      return
+    if session.get("db_primary_until", 0) > time.time():
+      return
+    g.db_replica = random.choice(replicas)
+    # what the replica may be missing; cache.store() keeps nothing built
+    # from it while a write that recent could be among it
+    g.db_replica_lag = self.get_app().config["SQLALCHEMY_REPLICA_LAG_WINDOW"]
+
+  def read_only(self, view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      self.use_replica()
+      return view(*args, **kwargs)
+    return wrapper
+
+  def pool_stats(self, app=None):
+    app = self.get_app(app)
+    engines = [(None, self.get_engine(app))]
+    engines += [(bind, self.get_engine(app, bind=bind)) for bind in self.replicas(app)]
+    stats = {}
+    for bind, engine in engines:
+      pool = engine.pool
+      stats[bind or "primary"] = {
+        "url": repr(engine.url),
+        "status": pool.status(),
+        "size": pool.size() if hasattr(pool, "size") else None,
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+        "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+      }
+    return stats
@@ -0,0 +1,188 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import timedelta
+from sqlalchemy import func, event, or_, DDL
+from sqlalchemy.exc import IntegrityError
+from app import app, db, Show, Venue, Artist
+from cache import cache, NullBackend
+
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#----------------------------------------------------------------------------#
+
+# A show occupies [start_time, end_time) at its venue and for its artist.
+# On Postgres two GiST exclusion constraints enforce that no venue or
+# artist is booked twice, and free/busy lookups are range scans of the
+# same indexes. Elsewhere an in-process interval tree per venue/artist
+# answers the same questions.
+
+EXCLUSIONS = [
+  ("ex_Show_venue_id_overlap", "venue_id"),
+  ("ex_Show_artist_id_overlap", "artist_id"),
+]
+
+for _name, _column in EXCLUSIONS:
+  # also for db.create_all(); the migration adds them to existing databases
+  event.listen(Show.__table__, "after_create", DDL(
+    f'ALTER TABLE "Show" ADD CONSTRAINT "{_name}" '
+    f'EXCLUDE USING gist ({_column} WITH =, tsrange(start_time, end_time) WITH &&)'
+  ).execute_if(dialect="postgresql"))
+event.listen(Show.__table__, "before_create",
+  DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"))
+
+COLUMNS = {"venue": Show.venue_id, "artist": Show.artist_id}
+
+
+class IntervalTree(object):
+  # Static augmented interval tree: intervals sorted by start plus a
+  # segment tree holding the greatest end of every index range.
+  # overlapping() only descends into subtrees that can contain a match,
+  # O(log n + k). Empty intervals never overlap anything, as in Postgres.
+  def __init__(self, intervals):
+    self.items = sorted(i for i in intervals if i[0] < i[1])
+    self.starts = [item[0] for item in self.items]
+    self.size = 1
+    while self.size < len(self.items):
+      self.size *= 2
+    self.max_end = [None] * (2 * self.size)
+    for i, item in enumerate(self.items):
+      self.max_end[self.size + i] = item[1]
+    for node in range(self.size - 1, 0, -1):
+      left, right = self.max_end[2 * node], self.max_end[2 * node + 1]
+      self.max_end[node] = left if right is None else right if left is None else max(left, right)
+
+  def __len__(self):
+    return len(self.items)
+
+  def overlapping(self, start, end):
+    # items with item_start < end and item_end > start, by start
+    limit = bisect_left(self.starts, end)
+    found = []
+    stack = [(1, 0, self.size)]
+    while stack:
+      node, lo, hi = stack.pop()
+      max_end = self.max_end[node]
+      if lo >= limit or max_end is None or max_end <= start:
+        continue
+      if hi - lo == 1:
+        found.append(self.items[lo])
+        continue
+      mid = (lo + hi) // 2
+      stack.append((2 * node + 1, mid, hi))
+      stack.append((2 * node, lo, mid))
+    return found
+
+
+_trees = OrderedDict()
+_trees_lock = threading.Lock()
+TREE_CACHE_SIZE = 1024
+
+
+def _tree(kind, id):
+  # Rebuilt when a write bumps the "shows" or "<kind>:<id>" cache tags.
+  # Without a cache backend there are no versions to check, so nothing is kept.
+  column = COLUMNS[kind]
+  load = lambda: IntervalTree(db.session.query(Show.start_time, Show.end_time, Show.id).filter(column == id))
+  if isinstance(cache.backend, NullBackend):
+    return load()
+  version = cache.versions(["shows", f"{kind}:{id}"])
+  entry = _trees.get((kind, id))
+  if entry is not None and entry[0] == version:
+    return entry[1]
+  tree = load()
+  with _trees_lock:
+    _trees[(kind, id)] = (version, tree)
+    _trees.move_to_end((kind, id))
+    while len(_trees) > TREE_CACHE_SIZE:
+      _trees.popitem(last=False)
+  return tree
+
+
+def naive(value):
+  # show times are naive wall-clock times; aware bounds are compared as such
+  return value.replace(tzinfo=None) if value.tzinfo is not None else value
+
+
+def overlapping(kind, id, start, end):
+  # -> [(start_time, end_time, show_id)] of the shows of one venue/artist
+  # overlapping [start, end), ordered by start
+  start, end = naive(start), naive(end)
+  if db.engine.dialect.name == "postgresql":
+    column = COLUMNS[kind]
+    rows = db.session.query(Show.start_time, Show.end_time, Show.id) \
+      .filter(column == id) \
+      .filter(func.tsrange(Show.start_time, Show.end_time).op("&&")(func.tsrange(start, end))) \
+      .order_by(Show.start_time)
+    return [tuple(row) for row in rows]
+  return _tree(kind, id).overlapping(start, end)
+
+
+def booked(venue_ids, artist_ids, start, end):
+  # -> {(kind, id): IntervalTree} of the existing shows of these venues and
+  # artists overlapping [start, end), in one query for a whole batch
+  venue_ids, artist_ids = set(venue_ids), set(artist_ids)
+  if not venue_ids and not artist_ids:
+    return {}
+  rows = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time, Show.id) \
+    .filter(Show.start_time < naive(end), Show.end_time > naive(start)) \
+    .filter(or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids))).all()
+  intervals = {}
+  for venue_id, artist_id, show_start, show_end, id in rows:
+    for key in (("venue", venue_id), ("artist", artist_id)):
+      intervals.setdefault(key, []).append((show_start, show_end, id))
+  return dict((key, IntervalTree(items)) for key, items in intervals.items())
+
+
+def conflicts(venue_id, artist_id, start, end):
+  # -> {"venue": [...], "artist": [...]}, only the kinds that clash
+  found = {}
+  for kind, id in (("venue", venue_id), ("artist", artist_id)):
+    shows = overlapping(kind, int(id), start, end)
+    if shows:
+      found[kind] = shows
+  return found
+
+
+def lock(venue_ids, artist_ids):
+  # Once "Show" is partitioned the exclusion constraints only hold within
+  # one month, so bookings take the venue and artist rows FOR UPDATE
+  # (venues first, each by id) before conflicts() and the insert.
+  if db.engine.dialect.name != "postgresql":
+    return
+  for model, ids in ((Venue, venue_ids), (Artist, artist_ids)):
+    ids = sorted(set(int(id) for id in ids))
+    if ids:
+      db.session.query(model.id).filter(model.id.in_(ids)).order_by(model.id).with_for_update().all()
+
+
+def is_conflict(error):
+  # a Postgres exclusion_violation from one of the constraints above
+  orig = getattr(error, "orig", None)
+  return isinstance(error, IntegrityError) and getattr(orig, "pgcode", None) == "23P01"
+
+
+def check_duration(start, end):
+  if not start < end <= start + timedelta(minutes=app.config["SHOW_MAX_DURATION"]):
+    raise ValueError(f"a show must last between 1 and {app.config['SHOW_MAX_DURATION']} minutes")
+
+
+def end_time(start, minutes=None):
+  end = start + timedelta(minutes=minutes or app.config["SHOW_DEFAULT_DURATION"])
+  check_duration(start, end)
+  return end
+
+
+def availability(venue_id, start, end):
+  # -> (busy, free) inside [start, end); busy shows may extend past either bound
+  start, end = naive(start), naive(end)
+  busy = overlapping("venue", venue_id, start, end)
+  free = []
+  cursor = start
+  for show_start, show_end, _ in busy:
+    if show_start > cursor:
+      free.append((cursor, show_start))
+    cursor = max(cursor, show_end)
+  if cursor < end:
+    free.append((cursor, end))
+  return busy, free
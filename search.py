@@ -0,0 +1,190 @@
+import heapq
+import threading
+from flask import g, has_request_context
+from sqlalchemy import func, or_, case
+from app import app, db, City, Venue, Artist, Genre, venue_genres, artist_genres
+from cache import cache, NullBackend
+from queries import upcoming_show_counts
+
+#----------------------------------------------------------------------------#
+# Trigram search.
+#----------------------------------------------------------------------------#
+
+# pg_trgm's default similarity threshold for the % operator
+SIMILARITY_THRESHOLD = 0.3
+# weight of a city / genre match relative to a name match
+SECONDARY_WEIGHT = 0.5
+
+
+def trigrams(text):
+  # Same decomposition as pg_trgm: lower-cased words padded with two
+  # leading blanks and one trailing blank.
+  grams = set()
+  for word in (text or "").lower().split():
+    word = "  " + "".join(ch for ch in word if ch.isalnum()) + " "
+    for i in range(len(word) - 2):
+      grams.add(word[i:i + 3])
+  return grams
+
+
+def similarity(a, b):
+  if not a or not b:
+    return 0.0
+  return len(a & b) / float(len(a | b))
+
+
+class TrigramIndex(object):
+  # Pure-Python stand-in for the GIN trigram indexes, used when the
+  # database is not Postgres (SQLite in development and tests).
+  def __init__(self):
+    self.docs = {}
+    self.names = {}
+    self.postings = {}
+
+  def add(self, id, name, *secondary):
+    fields = [(name or "").lower()] + [(f or "").lower() for f in secondary]
+    grams = [trigrams(f) for f in fields]
+    self.docs[id] = (fields, grams)
+    self.names[id] = name
+    for gram in set().union(*grams):
+      self.postings.setdefault(gram, set()).add(id)
+
+  def score(self, id, term, term_grams):
+    fields, grams = self.docs[id]
+    scores = [similarity(term_grams, g) for g in grams]
+    scores = [scores[0]] + [s * SECONDARY_WEIGHT for s in scores[1:]]
+    contains = any(term in f for f in fields)
+    if not contains and max(scores) < SIMILARITY_THRESHOLD * SECONDARY_WEIGHT:
+      return None
+    return (term in fields[0], max(scores))
+
+  def search(self, term, limit):
+    term = term.lower().strip()
+    term_grams = trigrams(term)
+    if len(term) < 3:
+      # too short to have a full trigram: substring scan like ILIKE
+      candidates = self.docs.keys()
+    else:
+      candidates = set()
+      for gram in term_grams:
+        candidates |= self.postings.get(gram, set())
+    scored = []
+    for id in candidates:
+      s = self.score(id, term, term_grams)
+      if s is not None:
+        scored.append((s, id))
+    top = heapq.nlargest(limit, scored)
+    return len(scored), [(id, self.names[id]) for _, id in top]
+
+
+def _is_postgres():
+  return db.engine.dialect.name == "postgresql"
+
+
+def _similar(column, term):
+  # pg_trgm's % operator, doubled for psycopg2's pyformat paramstyle
+  return column.op("%%")(term)
+
+
+def _ranked(query, name, secondary, genres, term):
+  pattern = f"%{term}%"
+  genre_match = genres.any(Genre.name.ilike(pattern))
+  matches = [name.ilike(pattern), _similar(name, term), genre_match]
+  for column in secondary:
+    matches += [column.ilike(pattern), _similar(column, term)]
+  rank = func.greatest(func.similarity(name, term), *[
+    func.similarity(column, term) * SECONDARY_WEIGHT for column in secondary
+  ] + [case([(genre_match, SECONDARY_WEIGHT)], else_=0)])
+  return query.filter(or_(*matches)), [
+    case([(name.ilike(pattern), 1)], else_=0).desc(), rank.desc(), name
+  ]
+
+
+def _genre_names(owner_column):
+  names = {}
+  rows = db.session.query(owner_column, Genre.name) \
+    .join(Genre, Genre.id == owner_column.table.c.genre_id)
+  for id, name in rows:
+    names[id] = names[id] + " " + name if id in names else name
+  return names
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index(tag, load):
+  # Rebuilt when a write bumps the "venues" / "artists" cache tag. Without
+  # a cache backend there are no versions to check, so nothing is kept;
+  # neither is an index read from a replica that may miss the last write.
+  if isinstance(cache.backend, NullBackend):
+    return load()
+  version = cache.versions([tag])
+  entry = _indexes.get(tag)
+  if entry is not None and entry[0] == version:
+    return entry[1]
+  index = load()
+  lag = g.get("db_replica_lag") if has_request_context() else None
+  if not (lag and cache.replica_behind(lag)):
+    with _indexes_lock:
+      _indexes[tag] = (version, index)
+  return index
+
+
+def _load(model, secondary, owner_column, joins):
+  index = TrigramIndex()
+  genre_names = _genre_names(owner_column)
+  for row in joins(db.session.query(model.id, model.name, *secondary)):
+    index.add(*(tuple(row) + (genre_names.get(row[0]),)))
+  return index
+
+
+def _search(tag, model, secondary, genres, owner_column, joins, term, limit):
+  term = term.strip()
+  if _is_postgres():
+    query, order = _ranked(
+      db.session.query(model.id, model.name), model.name, secondary, genres, term
+    )
+    query = joins(query)
+    count = query.order_by(None).count()
+    rows = query.order_by(*order).limit(limit).all()
+  else:
+    index = _index(tag, lambda: _load(model, secondary, owner_column, joins))
+    count, rows = index.search(term, limit)
+  return count, rows
+
+
+def search_venues(term, limit=None):
+  limit = limit or app.config["SEARCH_RESULTS_LIMIT"]
+  count, rows = _search(
+    "venues", Venue, [City.name], Venue.genres, venue_genres.c.venue_id,
+    lambda q: q.join(City, City.id == Venue.city_id),
+    term, limit
+  )
+  counts = upcoming_show_counts(Venue, [id for id, _ in rows])
+  return {
+    "count": count,
+    "data": [{
+      "id": id,
+      "name": name,
+      "num_upcoming_shows": counts.get(id, 0)
+    } for id, name in rows]
+  }
+
+
+def search_artists(term, limit=None):
+  limit = limit or app.config["SEARCH_RESULTS_LIMIT"]
+  count, rows = _search(
+    "artists", Artist, [Artist.city], Artist.genres, artist_genres.c.artist_id,
+    lambda q: q,
+    term, limit
+  )
+  counts = upcoming_show_counts(Artist, [id for id, _ in rows])
+  return {
+    "count": count,
+    "data": [{
+      "id": id,
+      "name": name,
+      "num_upcoming_shows": counts.get(id, 0)
+    } for id, name in rows]
+  }
@@ -0,0 +1,49 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+
+# config.py reads these when app is first imported
+_database = tempfile.NamedTemporaryFile(prefix="fyyur-test-", suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = "sqlite:///" + _database.name
+os.environ["CACHE_BACKEND"] = "null"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as fyyur, db, City, Venue, Artist, Show, Genre
+
+
+@pytest.fixture
+def app():
+  fyyur.config["TESTING"] = True
+  with fyyur.app_context():
+    db.create_all()
+  yield fyyur
+  with fyyur.app_context():
+    db.session.remove()
+    db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+
+@pytest.fixture
+def venue_with_shows(app):
+  # -> (venue id, artist id): one venue and one artist with several past
+  # and upcoming shows together, plus shows with other artists
+  now = datetime.today()
+  with app.app_context():
+    city = City(name="San Francisco", state="CA")
+    genres = [Genre(name="Jazz"), Genre(name="Blues")]
+    venue = Venue(name="The Musical Hop", city_parent=city, state="CA", genres=genres)
+    artists = [Artist(name=f"Artist {i}", city="San Francisco", state="CA", genres=genres[:1]) for i in range(5)]
+    db.session.add_all([city, venue] + artists)
+    db.session.flush()
+    for i, days in enumerate([-30, -20, -10, 10, 20, 30, 40]):
+      start = now + timedelta(days=days)
+      db.session.add(Show(venue_id=venue.id, artist_id=artists[i % len(artists)].id,
+                          start_time=start, end_time=start + timedelta(hours=2)))
+    db.session.commit()
+    return venue.id, artists[0].id
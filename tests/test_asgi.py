@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+
+pytest.importorskip("a2wsgi")
+import asgi
+
+
+def _get(path):
+  # -> (status, headers, body) of one GET through the ASGI app
+  scope = {
+    "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+    "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+    "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 1234), "server": ("localhost", 80),
+  }
+  messages = []
+
+  async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+  async def send(message):
+    messages.append(message)
+
+  asyncio.run(asgi.application(scope, receive, send))
+  start = next(m for m in messages if m["type"] == "http.response.start")
+  body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+  headers = [(k.decode().lower(), v.decode()) for k, v in start["headers"]]
+  return start["status"], headers, body
+
+
+def test_page_runs_request_hooks(app, venue_with_shows):
+  venue_id, _ = venue_with_shows
+  status, headers, body = _get(f"/venues/{venue_id}")
+  assert status == 200
+  assert b"The Musical Hop" in body
+  timings = [v for k, v in headers if k == "server-timing"]
+  assert any(v.startswith("db;") for v in timings)
+  assert any(v.startswith("render;") for v in timings)
+
+
+def test_handler_error_uses_the_app_error_page(app, venue_with_shows, monkeypatch):
+  venue_id, _ = venue_with_shows
+  def broken(venue_id):
+    raise RuntimeError("boom")
+  import app as views
+  monkeypatch.setattr(asgi, "venue_entry", broken)
+  monkeypatch.setattr(views, "venue_entry", broken)
+  monkeypatch.setitem(app.config, "PROPAGATE_EXCEPTIONS", False)
+  status, _, body = _get(f"/venues/{venue_id}")
+  assert status == 500
+  assert b"Something went wrong" in body
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+import geo
+from app import db, City, Venue, Artist, Show
+
+
+def _place(app):
+  # three venues: downtown, 5 km away and 40 km away
+  now = datetime.today()
+  with app.app_context():
+    city = City(name="San Francisco", state="CA", latitude=37.7749, longitude=-122.4194)
+    artist = Artist(name="Nearby Artist")
+    points = [(37.7749, -122.4194), (37.8199, -122.4194), (38.1349, -122.4194)]
+    venues = [Venue(name=f"Venue {i}", city_parent=city, state="CA", latitude=lat, longitude=lng,
+                    geohash=geo.encode(lat, lng)) for i, (lat, lng) in enumerate(points)]
+    db.session.add_all([city, artist] + venues)
+    db.session.flush()
+    for hours in range(1, 6):
+      for venue in venues:
+        start = now + timedelta(hours=hours, minutes=venue.id)
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=start,
+                            end_time=start + timedelta(minutes=30)))
+    db.session.commit()
+  return now
+
+
+def test_nearby_shows_in_radius_by_start_time(app):
+  now = _place(app)
+  with app.app_context():
+    shows = geo.nearby_shows(37.7749, -122.4194, 10, now, now + timedelta(days=1))
+  assert len(shows) == 10
+  assert set(venue.name for _, venue, _ in shows) == {"Venue 0", "Venue 1"}
+  starts = [show.start_time for _, _, show in shows]
+  assert starts == sorted(starts)
+  assert all(distance <= 10 for distance, _, _ in shows)
+
+
+def test_nearby_shows_limit(app):
+  now = _place(app)
+  with app.app_context():
+    shows = geo.nearby_shows(37.7749, -122.4194, 10, now, now + timedelta(days=1), limit=3)
+  assert [venue.name for _, venue, _ in shows] == ["Venue 0", "Venue 1", "Venue 0"]
+  assert shows[0][2].artist_name == "Nearby Artist"
+
+
+def test_shows_nearby_view(client, app):
+  _place(app)
+  response = client.get("/shows/nearby", query_string={"lat": 37.7749, "lng": -122.4194, "radius_km": 10})
+  assert response.status_code == 200
+  assert len(response.get_json()["data"]) == 10
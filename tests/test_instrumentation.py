@@ -0,0 +1,23 @@
+def _timings(response):
+  # Server-Timing: name;dur=ms[;desc=...] -> {name: ms}
+  timings = {}
+  for value in response.headers.getlist("Server-Timing"):
+    parts = dict(p.split("=", 1) for p in value.split(";")[1:])
+    timings[value.split(";")[0]] = float(parts["dur"])
+  return timings
+
+
+def test_rendered_page_reports_render_time(client):
+  response = client.get("/")
+  assert response.status_code == 200
+  timings = _timings(response)
+  assert timings["render"] > 0
+  assert timings["total"] >= timings["render"]
+
+
+def test_server_timing_counts_queries(client, venue_with_shows):
+  venue_id, _ = venue_with_shows
+  response = client.get(f"/venues/{venue_id}")
+  assert response.status_code == 200
+  db = [v for v in response.headers.getlist("Server-Timing") if v.startswith("db;")]
+  assert len(db) == 1 and "queries" in db[0]
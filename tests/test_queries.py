@@ -0,0 +1,40 @@
+from instrumentation import count_queries
+from queries import venue_detail, artist_detail
+
+
+def test_venue_detail_queries(app, venue_with_shows):
+  venue_id, _ = venue_with_shows
+  with app.app_context():
+    with count_queries() as counter:
+      data = venue_detail(venue_id)
+  assert counter.count <= 2
+  assert data["past_shows_count"] == 3
+  assert data["upcoming_shows_count"] == 4
+  assert data["genres"] == ["Blues", "Jazz"]
+
+
+def test_venue_page_queries(client, venue_with_shows):
+  venue_id, _ = venue_with_shows
+  with count_queries() as counter:
+    response = client.get(f"/venues/{venue_id}")
+  assert response.status_code == 200
+  assert b"Artist 4" in response.data
+  assert counter.count <= 2
+
+
+def test_artist_page_queries(client, venue_with_shows):
+  _, artist_id = venue_with_shows
+  with count_queries() as counter:
+    response = client.get(f"/artists/{artist_id}")
+  assert response.status_code == 200
+  assert b"The Musical Hop" in response.data
+  assert counter.count <= 2
+
+
+def test_artist_detail_splits_shows(app, venue_with_shows):
+  _, artist_id = venue_with_shows
+  with app.app_context():
+    data = artist_detail(artist_id)
+  # shows 0 and 5 of the fixture: 30 days ago, in 30 days
+  assert data["past_shows_count"] == 1
+  assert data["upcoming_shows_count"] == 1
@@ -0,0 +1,16 @@
+def _names(client, kind, q):
+  response = client.get(f"/shows/options/{kind}", query_string={"q": q})
+  assert response.status_code == 200
+  return [item["name"] for item in response.get_json()["data"]]
+
+
+def test_options_match_a_name_prefix(client, venue_with_shows):
+  assert _names(client, "artists", "artist") == [f"Artist {i}" for i in range(5)]
+  assert _names(client, "venues", "the mus") == ["The Musical Hop"]
+  assert _names(client, "venues", "musical") == []
+
+
+def test_options_match_wildcards_literally(client, venue_with_shows):
+  assert _names(client, "artists", "%") == []
+  assert _names(client, "artists", "_rtist") == []
+  assert _names(client, "artists", "Artist _") == []
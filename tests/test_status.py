@@ -0,0 +1,14 @@
+def test_pool_status_is_hidden_without_a_token(client):
+  assert client.get("/_status/pools").status_code == 404
+
+
+def test_pool_status_needs_the_token(app, client):
+  app.config["POOL_STATUS_TOKEN"] = "s3cret"
+  try:
+    assert client.get("/_status/pools").status_code == 404
+    assert client.get("/_status/pools", headers={"Authorization": "Bearer nope"}).status_code == 404
+    response = client.get("/_status/pools", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "primary" in response.get_json()
+  finally:
+    app.config["POOL_STATUS_TOKEN"] = None